@@ -0,0 +1,109 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+"""
+Startup benchmark for writebillings and drawbillings.
+
+Runs every mode several times in a fresh financial folder (using ExampleClient) and measures the wall-clock time of
+the whole process as well as the import time reported by 'python -X importtime'. Fails (exit code 1) if a median
+exceeds its threshold, or if 'start'/'end' import pandas.
+
+Usage: python benchmarks/bench_startup.py [-r RUNS] [--scale FACTOR]
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIENT_NAME = "ExampleClient"
+
+# (arguments, wall-clock threshold in ms, import time threshold in ms), run in this order
+MODES = {
+    "start": (["writebillings.py", "start", "-n", CLIENT_NAME, "-l", "BENCH", "-d", "benchmark"], 300, 120),
+    "pause": (["writebillings.py", "pause"], 300, 120),
+    "unpause": (["writebillings.py", "unpause"], 300, 120),
+    "end": (["writebillings.py", "end", "-d", "benchmark"], 300, 120),
+    "check": (["writebillings.py", "check", "--full"], 1500, 1000),
+    "print": (["writebillings.py", "print"], 1500, 1000),
+    "draw": (["drawbillings.py", CLIENT_NAME], 5000, 3000),
+}
+LIGHT_MODES = ["start", "pause", "unpause", "end"]  # must not import pandas
+
+
+def parse_importtime(stderr):
+    """
+    :return: Total import time in ms and the names of all imported modules
+    """
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        modules.add(name.strip())
+    return total_us / 1000, modules
+
+
+def run(arguments, env, importtime=False):
+    """
+    Run a script of the repository. writebillings reports errors and exits with 0, so runs are also failed if their
+    output contains "Exception at" (like in stress_concurrency.py), a mode that fails early must not count as fast.
+    :return: (wall-clock time in ms, CompletedProcess)
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + arguments
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    wall = (time.perf_counter() - start) * 1000
+    if result.returncode != 0 or "Exception at" in result.stdout:
+        raise RuntimeError("{} failed:\n{}{}".format(" ".join(arguments), result.stdout, result.stderr))
+    return wall, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of each writebillings/drawbillings mode.")
+    parser.add_argument('-r', dest='runs', type=int, default=5, help="Number of runs per mode.")
+    parser.add_argument('--scale', dest='scale', type=float, default=1., help="Multiply all thresholds by this factor (slow machines).")
+    command_line_parse = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as financial_dir:
+        env = dict(os.environ, BILLINGS_FINANCIAL_DIR=financial_dir, MPLBACKEND="Agg")
+        run(["writebillings.py", "NEW", "-n", CLIENT_NAME], env)
+
+        wall_times = {mode: [] for mode in MODES}
+        import_times = {mode: [] for mode in MODES}
+        for _ in range(command_line_parse.runs):
+            for mode, (arguments, _, _) in MODES.items():
+                wall, _ = run(arguments, env)
+                wall_times[mode].append(wall)
+
+            # second pass through all modes (keeps the session state consistent) to measure the import time
+            for mode, (arguments, _, _) in MODES.items():
+                _, result = run(arguments, env, importtime=True)
+                import_ms, modules = parse_importtime(result.stderr)
+                import_times[mode].append(import_ms)
+                if mode in LIGHT_MODES and "pandas" in modules:
+                    failures.append("'{}' imports pandas".format(mode))
+
+    print("{:<10}{:>14}{:>14}{:>16}{:>16}".format("mode", "wall [ms]", "limit [ms]", "imports [ms]", "limit [ms]"))
+    for mode, (_, wall_limit, import_limit) in MODES.items():
+        wall = statistics.median(wall_times[mode])
+        imports = statistics.median(import_times[mode])
+        wall_limit *= command_line_parse.scale
+        import_limit *= command_line_parse.scale
+        print("{:<10}{:>14.1f}{:>14.0f}{:>16.1f}{:>16.0f}".format(mode, wall, wall_limit, imports, import_limit))
+        if wall > wall_limit:
+            failures.append("'{}' took {:.1f} ms (limit {:.0f} ms)".format(mode, wall, wall_limit))
+        if imports > import_limit:
+            failures.append("'{}' spent {:.1f} ms on imports (limit {:.0f} ms)".format(mode, imports, import_limit))
+
+    for failure in set(failures):
+        print("FAILED: "+failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from generate_workload import REPO_DIR, generate_workload
+
+"""
+Workload benchmark for writebillings and drawbillings.
+
+Generates a synthetic dataset (see generate_workload.py), then runs 'start', 'reset', 'end', 'check', 'print' and a
+headless drawbillings run on it several times. For every operation, the latency percentiles, the throughput and the
+peak RSS of the process are reported and stored as JSON together with the dataset parameters and the git commit, so
+results of different versions can be compared with --baseline.
+
+Usage: python benchmarks/bench_workload.py [-r RUNS] [--years Y] [--sessions-per-day S] [-o RESULTS.json] [--baseline OLD.json]
+"""
+
+# run in this order in every round, so there is an open session for 'reset' and 'end'
+OPERATIONS = {
+    "start": ["writebillings.py", "start", "-l", "BENCH", "-p", "Bench", "-d", "benchmark"],
+    "reset": ["writebillings.py", "reset", "-m", "1"],
+    "end": ["writebillings.py", "end", "-d", "benchmark"],
+    "check": ["writebillings.py", "check", "--full"],
+    "print": ["writebillings.py", "print"],
+    "draw": ["drawbillings.py", "{client_name}", "--output-dir", "{output_dir}"],
+}
+
+
+def run(arguments, env):
+    """
+    Run a script of the repository as a separate process. writebillings reports errors and exits with 0, so runs
+    are also failed if their output contains "Exception at" (like in stress_concurrency.py).
+    :return: (wall-clock time in ms, peak RSS in KiB or None if the platform cannot tell)
+    """
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:  # files, so large output cannot block the process
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable] + arguments, cwd=REPO_DIR, env=env, stdout=stdout, stderr=stderr)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            wall = (time.perf_counter() - start) * 1000
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in bytes on macOS and in KiB elsewhere
+            peak_rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+        else:
+            process.wait()
+            wall = (time.perf_counter() - start) * 1000
+            peak_rss = None
+        stdout.seek(0)
+        stderr.seek(0)
+        output, errors = stdout.read().decode(errors="replace"), stderr.read().decode(errors="replace")
+    if process.returncode != 0 or "Exception at" in output:
+        raise RuntimeError("{} failed:\n{}{}".format(" ".join(arguments), output, errors))
+    return wall, peak_rss
+
+
+def summarize(latencies, peak_rss):
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "runs": len(latencies),
+        "p50_ms": percentiles[49],
+        "p90_ms": percentiles[89],
+        "p99_ms": percentiles[98],
+        "mean_ms": statistics.mean(latencies),
+        "throughput_per_s": len(latencies) / (sum(latencies) / 1000),
+        "peak_rss_kib": max(peak_rss) if None not in peak_rss else None,
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print("{:<8}{:>10}{:>10}{:>10}{:>12}{:>16}".format("op", "p50 [ms]", "p90 [ms]", "p99 [ms]", "ops/s", "peak RSS [MiB]")
+          + ("{:>14}".format("p50 vs base") if baseline else ""))
+    for operation, stats in results["operations"].items():
+        rss = "{:.1f}".format(stats["peak_rss_kib"] / 1024) if stats["peak_rss_kib"] is not None else "-"
+        line = "{:<8}{:>10.1f}{:>10.1f}{:>10.1f}{:>12.2f}{:>16}".format(operation, stats["p50_ms"], stats["p90_ms"], stats["p99_ms"],
+                                                                        stats["throughput_per_s"], rss)
+        if baseline and operation in baseline["operations"]:
+            line += "{:>+13.1f}%".format(100 * (stats["p50_ms"] / baseline["operations"][operation]["p50_ms"] - 1))
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time writebillings and drawbillings on a synthetic dataset.")
+    parser.add_argument('-r', dest='runs', type=int, default=10, help="Number of runs per operation.")
+    parser.add_argument('--clients', type=int, default=1, help="Number of clients in the dataset.")
+    parser.add_argument('--years', type=float, default=1., help="Years of history in the dataset.")
+    parser.add_argument('--sessions-per-day', dest='sessions_per_day', type=int, default=4, help="Average number of sessions per working day.")
+    parser.add_argument('--labels', type=int, default=8, help="Number of distinct labels.")
+    parser.add_argument('--projects', type=int, default=5, help="Number of distinct projects.")
+    parser.add_argument('-o', dest='output', type=str, default=None,
+                        help="JSON file to store the results in (default: benchmarks/results/workload_<time>.json).")
+    parser.add_argument('--baseline', type=str, default=None, help="JSON results of an earlier run to compare with.")
+    args = parser.parse_args()
+
+    dataset = {"clients": args.clients, "years": args.years, "sessions_per_day": args.sessions_per_day,
+               "labels": args.labels, "projects": args.projects}
+
+    with tempfile.TemporaryDirectory() as financial_dir, tempfile.TemporaryDirectory() as output_dir:
+        dataset["sessions"] = generate_workload(financial_dir, **dataset)
+        env = dict(os.environ, BILLINGS_FINANCIAL_DIR=financial_dir, MPLBACKEND="Agg")
+
+        latencies, peak_rss = {}, {}
+        for client_name in dataset["sessions"]:
+            for _ in range(args.runs):
+                for operation, arguments in OPERATIONS.items():
+                    arguments = [a.format(output_dir=output_dir, client_name=client_name) for a in arguments]
+                    if operation == "start":
+                        arguments += ["-n", client_name]
+                    wall, rss = run(arguments, env)
+                    latencies.setdefault(operation, []).append(wall)
+                    peak_rss.setdefault(operation, []).append(rss)
+
+    results = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "dataset": dataset,
+        "operations": {operation: summarize(latencies[operation], peak_rss[operation]) for operation in OPERATIONS},
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(REPO_DIR, "benchmarks", "results", "workload_{}.json".format(datetime.now().strftime("%Y%m%d_%H%M%S")))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print("Results saved to "+output)
+
+
+if __name__ == "__main__":
+    main()
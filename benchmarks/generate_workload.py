@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+"""
+Synthetic workload generator for the benchmarks.
+
+Writes an active billings file and a '_history' folder tree (one past billings file per month) for each client into a
+financial folder. Sessions fall on working days between 08:00 and 22:00, their labels and projects are drawn from
+vocabularies of the given size with a few names being much more common than the rest, like in real billings files.
+
+The clients (BenchClient000, BenchClient001, ...) are added to the client registry file of the financial folder.
+
+Usage: python benchmarks/generate_workload.py DIR [--clients N] [--years Y] [--sessions-per-day S] [--labels L] [--projects P]
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAY_START_HOUR, DAY_END_HOUR = 8, 22
+
+
+def pick_set(rng, vocabulary, weights):
+    """
+    :return: Comma-separated set of 1 to 3 distinct names
+    """
+    names = rng.choices(vocabulary, weights=weights, k=rng.randint(1, min(3, len(vocabulary))))
+    return ",".join(dict.fromkeys(names))
+
+
+def generate_sessions(rng, first_day, last_day, sessions_per_day, labels, projects):
+    """
+    :return: Sessions as (start, labels, projects, description, end, minutes) from first_day to last_day (both dates)
+    """
+    label_weights = [1 / (i + 1) for i in range(len(labels))]
+    project_weights = [1 / (i + 1) for i in range(len(projects))]
+    max_minutes = max(10, (DAY_END_HOUR - DAY_START_HOUR) * 60 // max(1, 2 * sessions_per_day))
+
+    sessions = []
+    day = first_day
+    while day <= last_day:
+        if day.weekday() < 5:
+            time = datetime(day.year, day.month, day.day, DAY_START_HOUR)
+            for _ in range(rng.randint(0, 2 * sessions_per_day)):
+                start = time + timedelta(minutes=rng.randint(0, max_minutes))
+                minutes = rng.randint(5, max_minutes)
+                end = start + timedelta(minutes=minutes)
+                if end.hour >= DAY_END_HOUR or end.date() != day:
+                    break
+                sessions.append((start, pick_set(rng, labels, label_weights), pick_set(rng, projects, project_weights),
+                                 "Session {}".format(len(sessions)), end, minutes))
+                time = end
+        day += timedelta(days=1)
+    return sessions
+
+
+def write_billings_file(path, sessions, header_string, time_format):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(header_string + "\n")
+        for start, labels, projects, description, end, minutes in sessions:
+            f.write(";".join([start.strftime(time_format), labels, projects, description, end.strftime(time_format), str(minutes)]) + ";\n")
+
+
+def register_clients(registry_path, names):
+    registry = {}
+    if os.path.exists(registry_path):
+        with open(registry_path, 'r', encoding='utf-8') as f:
+            registry = json.load(f)
+    for name in names:
+        registry[name] = {"hourly_wage": 20., "currency_symbol": "€", "language": "EN", "due_date": 31}
+    os.makedirs(os.path.dirname(registry_path), exist_ok=True)
+    with open(registry_path, 'w', encoding='utf-8') as f:
+        json.dump(registry, f, indent=1, ensure_ascii=False)
+
+
+def generate_workload(financial_dir, clients=1, years=1., sessions_per_day=4, labels=8, projects=5, seed=0):
+    """
+    Register the benchmark clients and write their billings files into financial_dir
+    :return: Number of sessions written per client name
+    """
+    os.environ["BILLINGS_FINANCIAL_DIR"] = financial_dir
+    sys.path.insert(0, REPO_DIR)
+    import billingsconstants  # the registry file is only read on the first lookup
+
+    names = ["BenchClient{:03d}".format(i) for i in range(clients)]
+    register_clients(os.path.join(financial_dir, billingsconstants.CLIENT_REGISTRY_NAME), names)
+
+    rng = random.Random(seed)
+    label_names = ["LABEL{:02d}".format(i) for i in range(labels)]
+    project_names = ["Project{:02d}".format(i) for i in range(projects)]
+    today = datetime.now().date()
+    month_start = today.replace(day=1)
+
+    counts = {}
+    for client in [billingsconstants.get_client_by_name(name) for name in names]:
+        first_day = month_start - timedelta(days=int(365 * years))
+        sessions = generate_sessions(rng, first_day, today - timedelta(days=1), sessions_per_day, label_names, project_names)
+
+        months = {}
+        for session in sessions:
+            months.setdefault(session[0].strftime("%Y-%m"), []).append(session)
+        active_month = month_start.strftime("%Y-%m")
+        for month, month_sessions in months.items():
+            if month != active_month:
+                path = os.path.join(client.history_folder, month, client.past_billings_filename)
+                write_billings_file(path, month_sessions, billingsconstants.header_string, billingsconstants.time_format)
+        write_billings_file(client.billings_filepath, months.get(active_month, []), billingsconstants.header_string, billingsconstants.time_format)
+        counts[client.name] = len(sessions)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic billings files and history folders for benchmarking.")
+    parser.add_argument('financial_dir', type=str, help="Folder to write the billings files to (used as FINANCIAL_DIR).")
+    parser.add_argument('--clients', type=int, default=1, help="Number of clients.")
+    parser.add_argument('--years', type=float, default=1., help="Years of history before the current month.")
+    parser.add_argument('--sessions-per-day', dest='sessions_per_day', type=int, default=4, help="Average number of sessions per working day.")
+    parser.add_argument('--labels', type=int, default=8, help="Number of distinct labels.")
+    parser.add_argument('--projects', type=int, default=5, help="Number of distinct projects.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random generator.")
+    args = parser.parse_args()
+
+    counts = generate_workload(args.financial_dir, args.clients, args.years, args.sessions_per_day, args.labels, args.projects, args.seed)
+    for name, count in counts.items():
+        print("{}: {} sessions".format(name, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Concurrency stress test for writebillings.
+
+Closes one session in a fresh financial folder, then fires many 'reset -m 1' commands at the same time, each of which
+reads the last session, adds a minute and writes it back. If any two commands overwrote each other, the session ends up
+with fewer minutes than commands were run. Fails (exit code 1) if a minute was lost, otherwise reports the sustained
+commands per second. With --daemon, the commands go through quickbillings.py and a running billingsdaemon.py, which
+commits commands that arrive together as a group.
+
+Usage: python benchmarks/stress_concurrency.py [-n COMMANDS] [-p PARALLEL] [--daemon]
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIENT_NAME = "ExampleClient"
+
+
+def run(arguments, env):
+    result = subprocess.run([sys.executable] + arguments, cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0 or "Exception at" in result.stdout:
+        raise RuntimeError("{} failed:\n{}{}".format(" ".join(arguments), result.stdout, result.stderr))
+    return result.stdout
+
+
+def read_sessions(financial_dir):
+    with open(os.path.join(financial_dir, CLIENT_NAME + "_billings.csv"), 'r') as f:
+        return [l for l in f.read().splitlines()[1:] if l.strip()]
+
+
+def start_daemon(env, socket_path):
+    daemon = subprocess.Popen([sys.executable, "billingsdaemon.py"], cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL)
+    while not os.path.exists(socket_path):
+        if daemon.poll() is not None:
+            raise RuntimeError("The daemon did not start")
+        time.sleep(0.05)
+    return daemon
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many writebillings commands in parallel and check that none is lost.")
+    parser.add_argument('-n', dest='commands', type=int, default=200, help="Number of commands.")
+    parser.add_argument('-p', dest='parallel', type=int, default=32, help="Number of commands started at the same time.")
+    parser.add_argument('--daemon', action='store_true', help="Send the commands to billingsdaemon.py through quickbillings.py.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as financial_dir:
+        env = dict(os.environ, BILLINGS_FINANCIAL_DIR=financial_dir)
+        run(["writebillings.py", "NEW", "-n", CLIENT_NAME], env)
+        run(["writebillings.py", "start", "-n", CLIENT_NAME, "-l", "STRESS", "-p", "Stress", "-d", "stress test"], env)
+        run(["writebillings.py", "end", "-d", "stress test"], env)
+        initial_minutes = int(read_sessions(financial_dir)[-1].split(";")[5])
+
+        script = "writebillings.py"
+        daemon = None
+        if args.daemon:
+            sys.path.insert(0, REPO_DIR)
+            os.environ["BILLINGS_FINANCIAL_DIR"] = financial_dir
+            import billingsconstants
+            daemon = start_daemon(env, os.path.join(financial_dir, billingsconstants.DAEMON_SOCKET_NAME))
+            script = "quickbillings.py"
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+                outputs = list(executor.map(lambda _: run([script, "reset", "-m", "1", "-n", CLIENT_NAME], env), range(args.commands)))
+            elapsed = time.perf_counter() - start
+        finally:
+            if daemon is not None:
+                run(["billingsdaemon.py", "stop"], env)
+                daemon.wait()
+
+        sessions = read_sessions(financial_dir)
+
+    minutes = int(sessions[-1].split(";")[5])
+    expected = initial_minutes + args.commands
+    print("Commands: {}, parallel: {}, via daemon: {}".format(args.commands, args.parallel, args.daemon))
+    print("Sessions: {} (expected 1), minutes of the session: {} (expected {})".format(len(sessions), minutes, expected))
+    print("Sustained throughput: {:.1f} commands/s".format(args.commands / elapsed))
+    if len(sessions) != 1 or minutes != expected or len(outputs) != args.commands:
+        print("FAILED: commands were lost")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from billingsconstants import *
+from billingsstorage import *
+from billingsjournal import compact_journal
+from billingssessions import MINUTES_PER_DAY, MISSING_TIME, encode_times
+
+"""
+Health check of the billings files ('check' mode of writebillings).
+
+All timestamps are parsed at once instead of line by line. After every run, the byte offset and a hash of the
+part of the file that was found healthy are stored, so the next run only has to look at the lines added since.
+Clients with SQLite storage are always checked completely.
+"""
+
+
+def _prefix_hash(content, offset):
+    return hashlib.blake2b(content[:offset]).hexdigest()
+
+
+def _read_check_state(client):
+    if not os.path.exists(client.check_state_filepath):
+        return None
+    with open(client.check_state_filepath, 'r') as f:
+        return json.load(f)
+
+
+def _write_check_state(client, content, offset, line_index):
+    with open(client.check_state_filepath, 'w') as f:
+        json.dump({"offset": offset, "lines": line_index, "hash": _prefix_hash(content, offset)}, f)
+
+
+def get_expected_minutes(start_dates, end_dates):
+    """
+    Compute the session lengths from the start and end columns as epoch minutes (NaN where a time cannot be parsed)
+    Like timedelta.seconds, this only counts the minutes within a day.
+    """
+    start, end = encode_times(start_dates), encode_times(end_dates)
+    expected = ((end - start) % MINUTES_PER_DAY).astype(float)
+    expected[(start == MISSING_TIME) | (end == MISSING_TIME)] = np.nan
+    return pd.Series(expected, index=getattr(start_dates, "index", None))
+
+
+def _report_problems(faulty, expected, line_numbers, lines):
+    for pos in faulty.to_numpy().nonzero()[0]:
+        print("Problem found with record on line "+str(line_numbers[pos]))
+        print("Expected record minutes: "+("could not parse the times" if pd.isna(expected.iloc[pos]) else str(int(expected.iloc[pos]))))
+        print("Line values: "+lines[pos])
+
+
+def _check_sqlite(client, fix):
+    storage = get_storage(client)
+    records = storage.read_records()
+    expected = get_expected_minutes(pd.Series([r.start_date for _, r in records], dtype=str), pd.Series([r.end_date for _, r in records], dtype=str))
+    minutes = pd.to_numeric(pd.Series([r.minutes for _, r in records], dtype=str), errors='coerce')
+    faulty = ~((minutes - expected).abs() <= 0.1)
+
+    _report_problems(faulty, expected, range(1, len(records) + 1), [r.csv_format() for _, r in records])
+    dirtylines = int(faulty.sum())
+    if dirtylines > 0:
+        print("Counted "+str(dirtylines)+ " faulty line" + ("s" if dirtylines > 1 else "") + "(out of {})".format(len(records)))
+    else:
+        print("Got {} healthy lines out of {}.".format(len(records), len(records)))
+
+    fixable = faulty & expected.notna()
+    if fix and fixable.any():
+        compact_journal(client)
+        storage.update_minutes({records[pos][0]: int(expected.iloc[pos]) for pos in fixable.to_numpy().nonzero()[0]})
+        print("Fixed the minutes of {} line{} (previous version saved to {})".format(int(fixable.sum()), "" if fixable.sum() == 1 else "s", storage.snapshot_path))
+
+
+def check_billings(client, full=False, fix=False):
+    """
+    Check that the minutes of every session match its starting and ending time.
+    :param full: Check the whole file, even if a previous run already checked a part of it
+    :param fix: Rewrite the minutes of faulty sessions to match their starting and ending time
+    """
+    if client.storage == "sqlite":
+        return _check_sqlite(client, fix)
+
+    with open(client.billings_filepath, 'rb') as f:
+        content = f.read()
+
+    offset, first_line = 0, 0
+    state = None if full else _read_check_state(client)
+    if state is not None and state["offset"] <= len(content) and _prefix_hash(content, state["offset"]) == state["hash"]:
+        offset, first_line = state["offset"], state["lines"]
+
+    raw_lines = content[offset:].splitlines(keepends=True)
+    line_offsets = [offset]
+    for raw in raw_lines:
+        line_offsets.append(line_offsets[-1] + len(raw))
+
+    line_indices = [first_line + i for i, raw in enumerate(raw_lines) if raw.strip() and first_line + i > 0]
+    records = pd.Series([raw_lines[i - first_line].decode(BILLINGS_ENCODING).rstrip("\r\n") for i in line_indices], dtype=str)
+
+    fields = records.str.split(csv_delim, expand=True).reindex(columns=range(6))
+    expected = get_expected_minutes(fields[0], fields[4])
+    minutes = pd.to_numeric(fields[5], errors='coerce')
+    faulty = ~((minutes - expected).abs() <= 0.1)
+
+    _report_problems(faulty, expected, line_indices, records)
+
+    dirtylines = int(faulty.sum())
+    total_lines = first_line + len(raw_lines)
+    if offset > 0:
+        print("Skipped {} lines that were already checked (use --full to check them again)".format(first_line))
+    if dirtylines > 0:
+        print("Counted "+str(dirtylines)+ " faulty line" + ("s" if dirtylines > 1 else "") + "(out of {})".format(total_lines))
+    else:
+        print("Got {} healthy lines out of {}.".format(total_lines, total_lines))
+
+    # only lines with the six fields of a session (the closing delimiter may be missing) can be rebuilt
+    delimiters = records.str.count(csv_delim)
+    six_fields = (delimiters == 5) | ((delimiters == 6) & records.str.endswith(csv_delim))
+    fixable = faulty & expected.notna() & six_fields
+    if fix and fixable.any():
+        all_lines = content.decode(BILLINGS_ENCODING).splitlines()
+        for pos in fixable.to_numpy().nonzero()[0]:
+            record = csv_entry(*fields.iloc[pos, :5].tolist(), int(expected.iloc[pos]))
+            all_lines[line_indices[pos]] = record.csv_format()
+        while all_lines and all_lines[-1].strip() == "":
+            all_lines.pop()
+
+        compact_journal(client)  # the snapshot keeps the file as it was before the fix
+        rewrite_atomic(client.billings_filepath, all_lines)
+        print("Fixed the minutes of {} line{} (previous version saved to {})".format(int(fixable.sum()), "" if fixable.sum() == 1 else "s", get_storage(client).snapshot_path))
+
+        if not (faulty & ~fixable).any():
+            with open(client.billings_filepath, 'rb') as f:
+                content = f.read()
+            _write_check_state(client, content, len(content), len(content.splitlines()))
+        return  # line offsets changed, unfixable lines are found again by the next (full) run
+
+    if faulty.any():
+        first_faulty = line_indices[faulty.to_numpy().nonzero()[0][0]]
+        _write_check_state(client, content, line_offsets[first_faulty - first_line], first_faulty)
+    else:
+        _write_check_state(client, content, len(content), total_lines)
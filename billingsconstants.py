@@ -1,6 +1,8 @@
 import os 
+from functools import cached_property
 
 FINANCIAL_DIR =  r"C:\Set\Your\Path\Here"   # forward or backward slashes allowed
+FINANCIAL_DIR = os.environ.get("BILLINGS_FINANCIAL_DIR", FINANCIAL_DIR)  # e.g. for the benchmarks
 
 
 csv_delim = ";"
@@ -14,6 +16,19 @@ PAUSEFILE_NAME = "pause.txt"
 BILLINGSFILE_NAME = "billings.csv"
 CLIENT_CACHE_FILE_NAME = "lastclient.txt"
 BILLINGS_BACKUPFILE_NAME = "billings_backup.csv"
+BILLINGS_JOURNAL_NAME = "billings_journal.txt"
+HISTORY_CACHE_NAME = "history_cache.npz"
+CHECK_STATE_NAME = "check_state.txt"
+DAEMON_SOCKET_NAME = "billingsdaemon.sock"
+SQLITE_NAME = "billings.sqlite"
+DAILY_ROLLUP_NAME = "daily_rollup.bin"
+SESSION_INDEX_NAME = "session_index"  # folder, see billingsindex
+HISTORY_SUMMARY_NAME = "summary.json"
+CHART_MANIFEST_NAME = "charts.json"  # in the output folder of drawbillings --output-dir
+EXPORT_MANIFEST_NAME = "_export.json"  # in the output folder of drawbillings --export-dir ("_" so Parquet readers skip it)
+SQLITE_BACKUP_NAME = "billings_backup.sqlite"
+LOCK_FILE_NAME = "billings.lock"
+CLIENT_REGISTRY_NAME = "clients.json"  # clients in addition to the ones below, see ClientRegistry
 header_string = "Starting time;Labels;Projects;Description;Ending time;Minutes;"
 
 DEFAULT_CLIENT_NAME = None  # optionally set a default client name here
@@ -29,13 +44,85 @@ def to_truncated_string(amount):
 
 
 
-client_list = []
+class ClientRegistry:
+    """
+    All clients by name: the clients created below with Client(client_list, ...) and the clients in the registry file
+    (CLIENT_REGISTRY_NAME in the financial folder), e.g.
+        {"JaneDoe": {"hourly_wage": 25.0, "currency_symbol": "$", "language": "EN", "due_date": 31}}
+    The file is only read when a client is looked up, and a client from the file is only created when it is used.
+    Iterating (and indexing) gives the clients in the order they were created, then in the order of the file.
+    Clients created below take precedence over file entries with the same name.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._names = []
+        self._specs = {}
+        self._clients = {}
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        import json
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for name, spec in json.load(f).items():
+                if name not in self._specs and name not in self._clients:
+                    self._names.append(name)
+                    self._specs[name] = spec
+
+    def append(self, client):
+        if client.name not in self._clients and client.name not in self._specs:
+            self._names.append(client.name)
+        self._clients[client.name] = client
+
+    def get(self, name):
+        """
+        :return: Client with this name, None if there is none
+        """
+        if name not in self._clients:
+            self._load()
+            if name not in self._specs:
+                return None
+            self._clients[name] = Client(None, name, **self._specs[name])
+        return self._clients[name]
+
+    def names(self):
+        self._load()
+        return list(self._names)
+
+    def __contains__(self, name):
+        self._load()
+        return name in self._clients or name in self._specs
+
+    def __len__(self):
+        self._load()
+        return len(self._names)
+
+    def __iter__(self):
+        for name in self.names():
+            yield self.get(name)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.get(name) for name in self.names()[index]]
+        return self.get(self.names()[index])
+
+
+client_list = ClientRegistry(os.path.join(FINANCIAL_DIR, CLIENT_REGISTRY_NAME))
 class Client:
     """
     Describes a customer with unique projects and billable activities
     Name should be unique
 
     Due date is the day of the month (out of 31) on which the invoice is submitted and a new, current one is created
+
+    Storage is "csv" (sessions in the .csv billings file) or "sqlite" (sessions in an indexed database, see 'migrate' in writebillings)
+
+    The paths of the client's files are only computed when they are first used.
     """
     
     def get_billings_file_name(self):
@@ -44,32 +131,51 @@ class Client:
     def get_billings_backup_file_name(self):
         return self.name+"_"+BILLINGS_BACKUPFILE_NAME
 
-    def __init__(self, client_list, name, hourly_wage, currency_symbol, language, due_date):
+    def get_billings_journal_file_name(self):
+        return self.name+"_"+BILLINGS_JOURNAL_NAME
+
+    def __init__(self, client_list, name, hourly_wage, currency_symbol, language, due_date, storage="csv"):
+        """
+        :param client_list: Registry to add the client to, None for clients created by the registry itself
+        """
         self.name = name
-        self.billings_filepath = os.path.join(FINANCIAL_DIR, self.get_billings_file_name())
-        self.billings_backup_filepath = os.path.join(FINANCIAL_DIR, self.get_billings_backup_file_name())
         self.financial_folder = FINANCIAL_DIR
         self.hourly_wage = hourly_wage
         self.currency_symbol = currency_symbol
         self.past_billings_filename = "billings.csv"  # When traversing past work, assume this billings filename
-        self.pausefile_name = self.name + "_" +PAUSEFILE_NAME
-        self.history_folder = os.path.join(FINANCIAL_DIR, self.name+ "_history")
         self.language = language
         self.due_date = due_date
+        self.storage = storage
+
+        if client_list is not None:
+            client_list.append(self)
+
+    def _get_path(self, file_name):
+        return os.path.join(self.financial_folder, self.name + "_" + file_name)
+
+    billings_filepath = cached_property(lambda self: self._get_path(BILLINGSFILE_NAME))
+    billings_backup_filepath = cached_property(lambda self: self._get_path(BILLINGS_BACKUPFILE_NAME))  # snapshot the journal starts from
+    billings_journal_filepath = cached_property(lambda self: self._get_path(BILLINGS_JOURNAL_NAME))
+    check_state_filepath = cached_property(lambda self: self._get_path(CHECK_STATE_NAME))  # last healthy part of the billings file
+    pausefile_name = cached_property(lambda self: self.name + "_" + PAUSEFILE_NAME)
+    history_folder = cached_property(lambda self: os.path.join(self.financial_folder, self.name + "_history"))
+    history_cache_filepath = cached_property(lambda self: self._get_path(HISTORY_CACHE_NAME))
+    daily_rollup_filepath = cached_property(lambda self: self._get_path(DAILY_ROLLUP_NAME))
+    session_index_filepath = cached_property(lambda self: self._get_path(SESSION_INDEX_NAME))
+    sqlite_filepath = cached_property(lambda self: self._get_path(SQLITE_NAME))
+    sqlite_backup_filepath = cached_property(lambda self: self._get_path(SQLITE_BACKUP_NAME))
 
-        client_list.append(self)
-        
 
 def get_client_by_name(name):
     if name is None:
         return None
-    for client in client_list:
-        if client.name == name:
-            return client
+    client = client_list.get(name)
+    if client is not None:
+        return client
 
     print("Got name argument: "+name)
-    for client in client_list:
-        print("Client: "+client.name)
+    for client_name in client_list.names():
+        print("Client: "+client_name)
     raise RuntimeError("Client not found in list (is the name spelled correctly?)")
 
 """
@@ -81,6 +187,10 @@ Supported languages: EN and DE.
 
 Due date is the day of the month on which the invoice is created and a new time tracking file is created. Optional feature, use 31 for a sensible default. 
 
+Optionally, add storage="sqlite" as the last value to keep the sessions in a database instead of the .csv file (run 'writebillings.ps1 migrate' first). 
+
+With many clients, list them in clients.json in your financial folder instead of creating them here (see ClientRegistry for the format). 
+
 To create a new client, follow the instructions below
 """
 
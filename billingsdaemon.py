@@ -0,0 +1,146 @@
+import io
+import json
+import socket
+import sys
+import warnings
+from contextlib import redirect_stdout, redirect_stderr
+
+from billingsconstants import *
+from billingslock import billings_lock, group_commit
+
+"""
+Optional resident server for writebillings commands.
+
+Starting Python and importing writebillings takes far longer than the command itself. 'python billingsdaemon.py'
+keeps one process with everything imported running and listens on a Unix domain socket in the financial folder
+('python billingsdaemon.py stop' stops it).
+quickbillings.py forwards its command line arguments to this process and prints the output, or runs the command
+itself when no daemon is running (or the platform has no Unix domain sockets).
+
+Commands are handled one after another, so two commands never modify a billings file at the same time. Commands that
+arrive within GROUP_COMMIT_WINDOW_SECONDS of each other are committed as a group: they run under a single lock of the
+financial folder and every written file is synced to disk once, before any of them is answered (see billingslock).
+"""
+
+DAEMON_SOCKET_PATH = os.path.join(FINANCIAL_DIR, DAEMON_SOCKET_NAME)
+DAEMON_TIMEOUT_SECONDS = 30
+GROUP_COMMIT_WINDOW_SECONDS = 0.005
+GROUP_COMMIT_MAX_COMMANDS = 64
+
+
+def _receive_all(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def send_command(argv, socket_path=DAEMON_SOCKET_PATH):
+    """
+    Have the daemon run a writebillings command.
+    :param argv: Command line arguments for writebillings
+    :return: Output of the command, None if no daemon is listening
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(DAEMON_TIMEOUT_SECONDS)
+            connection.connect(socket_path)
+            connection.sendall(json.dumps({"argv": argv}).encode("utf-8"))
+            connection.shutdown(socket.SHUT_WR)
+            response = json.loads(_receive_all(connection).decode("utf-8"))
+    except (ConnectionRefusedError, FileNotFoundError):  # stale socket file
+        return None
+
+    return response["output"]
+
+
+def run_command(argv):
+    """
+    Run a writebillings command in this process and capture everything it prints
+    """
+    import writebillings
+
+    output = io.StringIO()
+    with redirect_stdout(output), redirect_stderr(output), warnings.catch_warnings():
+        warnings.simplefilter("always")  # otherwise repeated warnings would only be shown for the first command
+        writebillings.main(argv)
+    return output.getvalue()
+
+
+def _read_request(connection):
+    """
+    :return: Command line arguments sent over a new connection
+    """
+    connection.settimeout(DAEMON_TIMEOUT_SECONDS)
+    return json.loads(_receive_all(connection).decode("utf-8"))["argv"]
+
+
+def _accept_batch(server):
+    """
+    Wait for a command, then collect the commands that arrive within GROUP_COMMIT_WINDOW_SECONDS after it
+    :return: List of (connection, command line arguments)
+    """
+    batch = []
+    server.settimeout(None)
+    while len(batch) < GROUP_COMMIT_MAX_COMMANDS:
+        try:
+            connection, _ = server.accept()
+        except socket.timeout:
+            break
+        try:
+            batch.append((connection, _read_request(connection)))
+        except (OSError, ValueError, KeyError) as e:
+            print("Dropped request: "+str(e))
+            connection.close()
+        server.settimeout(GROUP_COMMIT_WINDOW_SECONDS)
+    return batch
+
+
+def serve(socket_path=DAEMON_SOCKET_PATH):
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("Unix domain sockets are not supported on this platform, use writebillings directly")
+
+    import writebillings  # noqa: F401 (import everything before the first command arrives)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        os.chmod(socket_path, 0o600)
+        server.listen(GROUP_COMMIT_MAX_COMMANDS)
+        print("Listening on "+socket_path)
+        try:
+            stop = False
+            while not stop:
+                batch = _accept_batch(server)
+                outputs = []
+                # one lock and one fsync per written file for the whole batch, answers are sent once it is on disk
+                with billings_lock(), group_commit():
+                    for _, argv in batch:
+                        if argv == ["STOP"]:
+                            stop = True
+                            outputs.append("Daemon stopped\n")
+                        else:
+                            outputs.append(run_command(argv))
+
+                for (connection, _), output in zip(batch, outputs):
+                    with connection:
+                        try:
+                            connection.sendall(json.dumps({"output": output}).encode("utf-8"))
+                        except OSError as e:
+                            print("Could not answer request: "+str(e))
+        finally:
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "stop":
+        print(send_command(["STOP"]) or "No daemon running")
+    else:
+        serve()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from billingsconstants import *
+from billingsreport import READ_COLUMNS, format_period, get_periods, load_all_sessions
+from billingsrollup import get_file_stamp
+from billingshistory import find_history_files
+from billingssessions import MISSING_MINUTES, MISSING_TIME
+from billingsstorage import replace_file
+
+"""
+Export of all sessions (active and history) to a Parquet dataset for other tools (drawbillings --export-dir).
+
+The dataset is partitioned by client and month of the starting time, in hive style:
+'<DIR>/client=<name>/month=<YYYY-MM>/part-0.parquet'. Every file has the columns
+    start, end: timestamp[ms] (local time, as written to the billings file; end is null for an open session)
+    minutes: int32 (null for an open session)
+    labels, projects: list<string>
+    description: string
+sorted by the starting time. Sessions whose starting time cannot be read are left out ('check' reports them).
+
+A manifest (EXPORT_MANIFEST_NAME) in the output folder keeps the stamps of the files every client was read from and a
+hash of the rows of every partition. Clients whose files did not change are not read again, and of the other clients
+only the partitions whose rows changed are written. Partitions of months without sessions are removed.
+Needs pyarrow.
+"""
+
+EXPORT_FORMAT_VERSION = 1  # written to the manifest, a different version exports everything again
+EXPORT_COLUMNS = READ_COLUMNS[:3] + ["Description"] + READ_COLUMNS[3:]
+PARTITION_FILE_NAME = "part-0.parquet"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Exporting to Parquet needs pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+def get_source_stamps(client):
+    """
+    :return: Map from every file the sessions of a client are read from to its [size, modification time in ns]
+    """
+    if client.storage == "sqlite":
+        paths = [client.sqlite_filepath, client.sqlite_filepath + "-wal"]
+    else:
+        paths = [client.billings_filepath] + find_history_files(client)
+    return {path: list(get_file_stamp(path)) for path in paths}
+
+
+def get_partition_folder(output_dir, client_name, month):
+    return os.path.join(output_dir, "client=" + quote(client_name, safe=""), "month=" + month)
+
+
+def _to_set_lists(pa, set_ids, names, sets):
+    set_lists = pa.array([[names[i] for i in s] for s in sets], type=pa.list_(pa.string()))
+    return set_lists.take(pa.array(set_ids, type=pa.int32()))
+
+
+def build_table(sessions):
+    """
+    :param sessions: SessionTable with descriptions, sorted by the starting time
+    :return: pyarrow Table with the columns in the module docstring
+    """
+    pa, _ = _import_pyarrow()
+    data = sessions.sessions
+    descriptions = pd.Series(sessions.descriptions, dtype=object)
+    return pa.table({
+        "start": pa.array(data["start"] * 60000, type=pa.timestamp('ms')),
+        "end": pa.array(data["end"] * 60000, type=pa.timestamp('ms'), mask=data["end"] == MISSING_TIME),
+        "minutes": pa.array(data["minutes"], type=pa.int32(), mask=data["minutes"] == MISSING_MINUTES),
+        "labels": _to_set_lists(pa, data["labels"], sessions.label_names, sessions.label_sets),
+        "projects": _to_set_lists(pa, data["projects"], sessions.project_names, sessions.project_sets),
+        "description": pa.array(descriptions.where(descriptions.notna(), None), type=pa.string(), from_pandas=True),
+    })
+
+
+def hash_rows(sessions):
+    """
+    :return: uint64 hash of every session (over all exported columns)
+    """
+    data = sessions.sessions
+    return pd.util.hash_pandas_object(pd.DataFrame({
+        "start": data["start"], "end": data["end"], "minutes": data["minutes"],
+        "labels": sessions.get_set_strings("labels"), "projects": sessions.get_set_strings("projects"),
+        "description": pd.Series(sessions.descriptions, dtype=object),
+    }), index=False).to_numpy()
+
+
+def _write_parquet(table, path):
+    _, pq = _import_pyarrow()
+    temp_path = path + ".tmp"
+    pq.write_table(table, temp_path)
+    replace_file(temp_path, path)
+
+
+def _remove_partition(output_dir, client_name, month):
+    folder = get_partition_folder(output_dir, client_name, month)
+    path = os.path.join(folder, PARTITION_FILE_NAME)
+    if os.path.exists(path):
+        os.remove(path)
+    if os.path.isdir(folder) and not os.listdir(folder):
+        os.rmdir(folder)
+
+
+def export_client(client, output_dir, entry):
+    """
+    Export the partitions of a client whose rows changed since the export described by entry
+    :param entry: Manifest entry of the client from the last export ({} if there is none)
+    :return: (new manifest entry, number of sessions, number of partitions written, number of partitions unchanged)
+    """
+    sources = get_source_stamps(client)
+    partitions = entry.get("partitions", {})
+    if entry.get("sources") == sources and all(os.path.exists(os.path.join(get_partition_folder(output_dir, client.name, month), PARTITION_FILE_NAME))
+                                               for month in partitions):
+        return entry, entry.get("sessions", 0), 0, len(partitions)
+
+    sessions = load_all_sessions(client, columns=EXPORT_COLUMNS)
+    readable = sessions.sessions["start"] != MISSING_TIME
+    if not readable.all():
+        print("Left out {} sessions of {} whose starting time cannot be read".format(int((~readable).sum()), client.name))
+    order = np.flatnonzero(readable)[np.argsort(sessions.sessions["start"][readable], kind='stable')]
+    sessions.sessions = sessions.sessions[order]
+    sessions.descriptions = [sessions.descriptions[i] for i in order]
+
+    table = build_table(sessions)
+    row_hashes = hash_rows(sessions)
+    index, first_days = get_periods(sessions.sessions["start"], "month")
+    bounds = np.searchsorted(index, np.arange(len(first_days) + 1))  # sessions are sorted, so every month is one slice
+
+    new_partitions = {}
+    written = 0
+    for i, first_day in enumerate(first_days):
+        month = format_period(first_day, "month")
+        start, stop = bounds[i], bounds[i + 1]
+        key = hashlib.sha1(row_hashes[start:stop].tobytes()).hexdigest()
+        new_partitions[month] = key
+        folder = get_partition_folder(output_dir, client.name, month)
+        if partitions.get(month) == key and os.path.exists(os.path.join(folder, PARTITION_FILE_NAME)):
+            continue
+        os.makedirs(folder, exist_ok=True)
+        _write_parquet(table.slice(start, stop - start), os.path.join(folder, PARTITION_FILE_NAME))
+        written += 1
+    for month in set(partitions) - set(new_partitions):
+        _remove_partition(output_dir, client.name, month)
+
+    return {"sources": sources, "sessions": len(order), "partitions": new_partitions}, len(order), written, len(new_partitions) - written
+
+
+def read_manifest(output_dir):
+    path = os.path.join(output_dir, EXPORT_MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    return manifest.get("clients", {}) if manifest.get("version") == EXPORT_FORMAT_VERSION else {}
+
+
+def write_manifest(output_dir, clients):
+    path = os.path.join(output_dir, EXPORT_MANIFEST_NAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump({"version": EXPORT_FORMAT_VERSION, "clients": clients}, f, indent=1, ensure_ascii=False)
+    replace_file(path + ".tmp", path)
+
+
+def export_sessions(clients, output_dir):
+    """
+    Export the sessions of the given clients to a Parquet dataset in output_dir (see the module docstring).
+    The manifest entries of other clients are kept.
+    """
+    _import_pyarrow()
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = read_manifest(output_dir)
+    for client in clients:
+        manifest[client.name], sessions, written, unchanged = export_client(client, output_dir, manifest.get(client.name, {}))
+        write_manifest(output_dir, manifest)  # after every client, so an interrupted export keeps what was written
+        print("Exported {}: {} sessions, {} monthly partitions written, {} unchanged".format(client.name, sessions, written, unchanged))
+    print("Parquet dataset (partitioned by client and month): " + output_dir)
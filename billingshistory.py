@@ -0,0 +1,178 @@
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+
+from billingsconstants import *
+from billingssessions import EPOCH_ORDINAL, MINUTES_PER_DAY, load_sessions, map_time_columns
+from billingstimings import NO_TIMER
+from billingsstorage import get_storage
+from billingsrollover import read_summary
+
+"""
+Cached access to the billings files in a client's history folder.
+
+Past billings files practically never change, so their 'Starting time' (as epoch minutes) and 'Minutes' columns are
+kept in a per-client .npz cache next to the billings file. Every cached file is keyed by its path, modification time and size, and only
+files that are new or were changed since the cache was written are parsed again. Files archived by a rollover are not
+parsed at all, their day totals are taken from the summary written next to them (see billingsrollover).
+
+With an executor, the files are parsed in worker processes. All cache bookkeeping happens in the calling process,
+so the results are the same as when parsing serially.
+"""
+
+
+def find_history_files(client):
+    """
+    Walk the history folder of a client and collect the past billings files
+    :return: List of file paths, in walking order
+    """
+    history_files = []
+    for dir_path, directory_names, file_names in os.walk(client.history_folder, topdown=True):
+        if os.path.exists(os.path.join(dir_path, client.past_billings_filename)):
+            history_files.append(os.path.join(dir_path, client.past_billings_filename))
+        elif os.path.exists(os.path.join(dir_path, client.get_billings_file_name())):
+            history_files.append(os.path.join(dir_path, client.get_billings_file_name()))
+    return history_files
+
+
+def read_time_columns(path):
+    """
+    Parse the 'Starting time' (as epoch minutes, see billingssessions) and 'Minutes' columns of a billings file
+    """
+    starting_time, _, minutes = map_time_columns(path)
+    return starting_time, minutes
+
+
+def read_active_billings(client, window=None):
+    """
+    Read the active sessions of a client (everything but the descriptions) into a SessionTable
+    :param window: Only read the sessions in this TimeWindow (see billingsstorage.get_window)
+    """
+    return load_sessions(client, window=window)
+
+
+def get_summary_columns(summary):
+    """
+    :return: 'Starting time' and 'Minutes' columns with one row per day of a rollover summary
+    """
+    days = list(summary["days"])
+    ordinals = np.array([datetime.strptime(day, time_format_daily).toordinal() for day in days], dtype=np.int64)
+    return (ordinals - EPOCH_ORDINAL) * MINUTES_PER_DAY, np.array([summary["days"][day] for day in days], dtype=float)
+
+
+def _submit(executor, fn, *args):
+    if executor is not None:
+        return executor.submit(fn, *args)
+
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _load_cache(client):
+    cached = {}
+    if not os.path.exists(client.history_cache_filepath):
+        return cached
+    try:
+        with np.load(client.history_cache_filepath, allow_pickle=False) as cache:
+            if not np.issubdtype(cache["starting_time"].dtype, np.integer):  # written by an older version
+                return {}
+            ends = np.cumsum(cache["lengths"])
+            for i, path in enumerate(cache["paths"]):
+                start = ends[i] - cache["lengths"][i]
+                cached[str(path)] = (int(cache["mtimes"][i]), int(cache["sizes"][i]),
+                                     cache["starting_time"][start:ends[i]], cache["minutes"][start:ends[i]])
+    except (OSError, ValueError, KeyError) as e:
+        print("Could not read history cache, rebuilding it ({})".format(e))
+        return {}
+    return cached
+
+
+def _write_cache(client, entries):
+    paths = list(entries.keys())
+    temp_path = client.history_cache_filepath + ".tmp"
+    with open(temp_path, 'wb') as f:
+        np.savez(f,
+                 paths=np.array(paths, dtype=str),
+                 mtimes=np.array([entries[p][0] for p in paths], dtype=np.int64),
+                 sizes=np.array([entries[p][1] for p in paths], dtype=np.int64),
+                 lengths=np.array([len(entries[p][2]) for p in paths], dtype=np.int64),
+                 starting_time=np.concatenate([entries[p][2] for p in paths]) if paths else np.array([], dtype=np.int64),
+                 minutes=np.concatenate([entries[p][3] for p in paths]) if paths else np.array([], dtype=float))
+    os.replace(temp_path, client.history_cache_filepath)
+
+
+def load_history(client, rebuild_cache=False, executor=None, timer=NO_TIMER):
+    """
+    Get the 'Starting time' and 'Minutes' columns of every past billings file of a client,
+    parsing only the files that are not up to date in the cache.
+    :param rebuild_cache: Ignore the cache and parse every file
+    :param executor: Optional concurrent.futures executor to parse the files with
+    :param timer: PhaseTimer to record the phases with (see billingstimings)
+    :return: List of (starting time, minutes) arrays, one per history file
+    """
+    if client.storage == "sqlite":  # history was migrated into the database
+        with timer.phase("read history", client):
+            return get_storage(client).read_history_columns()
+
+    with timer.phase("read history cache", client):
+        cached = {} if rebuild_cache else _load_cache(client)
+    entries = {}
+    parsing = {}
+    changed = rebuild_cache
+
+    with timer.phase("walk history", client):
+        history_files = find_history_files(client)
+
+    with timer.phase("parse history", client):
+        for path in history_files:
+            stat = os.stat(path)
+            if path in cached and cached[path][0] == stat.st_mtime_ns and cached[path][1] == stat.st_size:
+                entries[path] = cached[path]
+            else:
+                entries[path] = (stat.st_mtime_ns, stat.st_size)
+                summary = read_summary(path)
+                if summary is not None:
+                    entries[path] = entries[path] + get_summary_columns(summary)
+                else:
+                    parsing[path] = _submit(executor, read_time_columns, path)
+                changed = True
+
+        for path, future in parsing.items():
+            entries[path] = entries[path] + future.result()
+
+    if changed or len(entries) != len(cached):
+        with timer.phase("write history cache", client):
+            _write_cache(client, entries)
+
+    return [(starting_time, minutes) for _, _, starting_time, minutes in entries.values()]
+
+
+def load_clients(clients, rebuild_cache=False, executor=None, window=None, timer=NO_TIMER):
+    """
+    Read the active billings file and the history of each client.
+    The active files of all clients are submitted to the executor first, so they are parsed while the
+    history folders are being checked against the caches.
+    :return: Map from client name to a future of (active SessionTable, history columns)
+    """
+    active = {}
+    for client in clients:
+        with timer.phase("read active billings", client):  # only the submission if there is an executor
+            active[client.name] = _submit(executor, read_active_billings, client, window)
+
+    client_data = {}
+    for client in clients:
+        future = Future()
+        try:
+            history = load_history(client, rebuild_cache=rebuild_cache, executor=executor, timer=timer)
+            with timer.phase("wait for active billings", client):
+                active_sessions = active[client.name].result()
+            future.set_result((active_sessions, history))
+        except Exception as e:
+            future.set_exception(e)
+        client_data[client.name] = future
+    return client_data
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+from billingsconstants import *
+from billingsstorage import rewrite_atomic
+from billingsjournal import compact_journal
+from billingshistory import find_history_files
+from billingssessions import MINUTES_PER_DAY, MISSING_TIME, encode_times, format_times, map_time_columns
+
+"""
+Bulk import of sessions ('import' mode of writebillings).
+
+Sessions are read from a .csv file with the columns of the billings file or from a file with one JSON object per line
+(keys as in JSON_KEYS or the column names). The whole batch is validated at once: every time must be in time_format,
+every session has to end after it starts and be shorter than a day (like for 'end' and 'check', only the minutes
+within a day are counted), given minutes have to match the starting and ending time, and no session may
+overlap another imported session or an existing one (in the active file or the history). If any session is invalid,
+nothing is written.
+Valid sessions are merged into the active billings file in chronological order, and the file is written once. The
+journal is compacted first, so the snapshot holds the billings file from before the import.
+"""
+
+JSON_KEYS = {"start": "Starting time", "labels": "Labels", "projects": "Projects", "description": "Description",
+             "end": "Ending time", "minutes": "Minutes"}
+COLUMNS = header_string.split(csv_delim)[:-1]
+MAX_REPORTED_PROBLEMS = 20
+
+
+def read_import_file(path):
+    """
+    :return: (DataFrame with the columns of the billings file as strings, line number in the file of every row)
+    """
+    if path.lower().endswith((".jsonl", ".json", ".ndjson")):
+        df = pd.read_json(path, lines=True, dtype=False).rename(columns=JSON_KEYS)
+        for column in ["Labels", "Projects"]:  # sets may be given as lists
+            if column in df.columns:
+                df[column] = df[column].map(lambda v: set_delim.join(v) if isinstance(v, list) else v)
+        first_line = 1
+    else:
+        with open(path, 'r') as f:
+            df = pd.read_csv(f, sep=csv_delim, dtype=str, keep_default_na=False)
+        first_line = 2
+
+    missing = [c for c in ["Starting time", "Ending time"] if c not in df.columns]
+    if missing:
+        raise RuntimeError("The import file has no column "+" or ".join("'"+c+"'" for c in missing))
+    defaults = {"Labels": default_label_string, "Projects": default_label_string, "Description": "", "Minutes": ""}
+    for column, default in defaults.items():
+        if column not in df.columns:
+            df[column] = default
+    df = df[COLUMNS].fillna(defaults).astype(str)
+    df.loc[df["Labels"].str.strip() == "", "Labels"] = default_label_string
+    df.loc[df["Projects"].str.strip() == "", "Projects"] = default_label_string
+    return df, np.arange(len(df)) + first_line
+
+
+def read_existing_sessions(client):
+    """
+    :return: (starting times, ending times) of the sessions in the active file and the history as epoch minutes
+    """
+    starts, ends = [], []
+    for path in [client.billings_filepath] + find_history_files(client):
+        if os.path.exists(path):
+            start, end, _ = map_time_columns(path)
+            starts.append(start)
+            ends.append(end)
+    return (np.concatenate(starts), np.concatenate(ends)) if starts else (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+
+def find_overlaps(start, end, existing_start, existing_end):
+    """
+    :return: Mask of the sessions (start, end) that overlap another one of them or one of the existing sessions
+    """
+    overlapping = np.zeros(len(start), dtype=bool)
+
+    order = np.argsort(start, kind='stable')
+    clash = start[order][1:] < np.maximum.accumulate(end[order])[:-1]  # starts before an earlier session ended
+    overlapping[order[1:][clash]] = True
+    overlapping[order[:-1][clash]] = True
+
+    valid = (existing_start != MISSING_TIME) & (existing_end != MISSING_TIME)
+    existing_order = np.argsort(existing_start[valid], kind='stable')
+    existing_start, existing_end = existing_start[valid][existing_order], existing_end[valid][existing_order]
+    if len(existing_start):
+        before = np.searchsorted(existing_start, start, side='right') - 1  # last existing session started at or before
+        latest_end = np.maximum.accumulate(existing_end)
+        overlapping |= (before >= 0) & (latest_end[np.maximum(before, 0)] > start)
+        after = before + 1  # first existing session started after
+        overlapping |= (after < len(existing_start)) & (existing_start[np.minimum(after, len(existing_start) - 1)] < end)
+    return overlapping
+
+
+def validate_import(df, line_numbers, existing_start, existing_end):
+    """
+    Check the whole batch at once (see the module docstring) and raise a RuntimeError listing the invalid sessions
+    :return: (starting times, ending times, minutes) of the sessions as int64 arrays
+    """
+    start, end = encode_times(df["Starting time"]), encode_times(df["Ending time"])
+    length = end - start
+    given = df["Minutes"].str.strip() != ""
+    minutes = pd.to_numeric(df["Minutes"].where(given), errors='coerce').to_numpy(dtype=float)
+    text = df[["Labels", "Projects", "Description"]]
+    bad_text = np.zeros(len(df), dtype=bool)
+    for column in text.columns:
+        bad_text |= text[column].str.contains(csv_delim, regex=False).to_numpy() | text[column].str.contains("\n", regex=False).to_numpy()
+
+    bad_time = (start == MISSING_TIME) | (end == MISSING_TIME)
+    checks = [
+        (bad_time, "times have to be in the format dd.mm.YYYY HH:MM"),
+        (~bad_time & (end <= start), "the session has to end after it starts"),
+        (~bad_time & (length >= MINUTES_PER_DAY), "the session has to be shorter than 24 hours"),
+        (given.to_numpy() & np.isnan(minutes), "minutes are not a number"),
+        (~bad_time & ~np.isnan(minutes) & (np.abs(minutes - length) > 0.1), "minutes do not match the starting and ending time"),
+        (bad_text, "labels, projects and description must not contain '{}' or line breaks".format(csv_delim)),
+    ]
+    timed = ~bad_time & (end > start)
+    overlapping = np.zeros(len(df), dtype=bool)
+    overlapping[timed] = find_overlaps(start[timed], end[timed], existing_start, existing_end)
+    checks.append((overlapping, "the session overlaps another session"))
+
+    problems = sorted((line, message) for mask, message in checks for line in line_numbers[mask])
+    if problems:
+        lines = sorted(set(line for line, _ in problems))
+        for line, message in problems[:MAX_REPORTED_PROBLEMS]:
+            print("Line {}: {}".format(line, message))
+        if len(problems) > MAX_REPORTED_PROBLEMS:
+            print("... and {} more problems".format(len(problems) - MAX_REPORTED_PROBLEMS))
+        raise RuntimeError("Found {} invalid session{} in the import file, nothing was imported".format(len(lines), "" if len(lines) == 1 else "s"))
+    return start, end, length
+
+
+def import_sessions(client, path):
+    """
+    Validate the sessions of an import file and merge them into the active billings file of a client
+    :return: Number of imported sessions
+    """
+    if client.storage != "csv":
+        raise RuntimeError("'import' only works with .csv storage")
+    if not os.path.exists(client.billings_filepath):
+        raise RuntimeError("Please create the billings file first (see 'NEW')")
+
+    df, line_numbers = read_import_file(path)
+    if len(df) == 0:
+        print("No sessions to import")
+        return 0
+
+    existing_start, existing_end = read_existing_sessions(client)
+    with open(client.billings_filepath, 'r') as f:
+        lines = [l.rstrip("\r\n") for l in f.readlines()]
+    header, existing_lines = (lines[0] if lines else header_string), [l for l in lines[1:] if l.strip()]
+    if existing_lines and existing_lines[-1].split(csv_delim)[4:5] == [""]:
+        raise RuntimeError("Please end the open session before importing")
+
+    start, end, minutes = validate_import(df, line_numbers, existing_start, existing_end)
+
+    imported = (pd.Series(format_times(start)) + csv_delim + df["Labels"].str.strip().reset_index(drop=True) + csv_delim +
+                df["Projects"].str.strip().reset_index(drop=True) + csv_delim + df["Description"].reset_index(drop=True) + csv_delim +
+                pd.Series(format_times(end)) + csv_delim + pd.Series(minutes).astype(str) + csv_delim).to_numpy()
+
+    # existing lines keep their order, lines whose time cannot be read stay right after the line before them
+    existing_keys = encode_times(pd.Series(existing_lines, dtype=str).str[:len("dd.mm.YYYY HH:MM")])
+    existing_keys = np.maximum.accumulate(existing_keys) if len(existing_keys) else existing_keys
+    keys = np.concatenate([existing_keys, start])
+    merged = np.concatenate([np.array(existing_lines, dtype=object), imported])[np.argsort(keys, kind='stable')]
+
+    compact_journal(client)  # the snapshot keeps the file from before the import
+    rewrite_atomic(client.billings_filepath, [header] + merged.tolist())
+
+    total = int(minutes.sum())
+    print("Imported {} sessions ({} hours, {}) into {}".format(len(df), to_truncated_string(total / 60),
+                                                             client.currency_symbol + to_truncated_string(total / 60 * client.hourly_wage),
+                                                             client.billings_filepath))
+    print("The billings file from before the import was saved to "+client.billings_backup_filepath)
+    return len(df)
@@ -0,0 +1,180 @@
+import json
+
+from billingsconstants import *
+from billingsrollup import get_file_stamp
+
+"""
+Per-client bitmap index from labels and projects to the active sessions that use them.
+
+Every label and project has a bitset (a Python int, bit i set if the i-th session of the billings file uses it), so
+filters like "label CODE and project Docker" are bitwise ANDs. The index is stored in a folder: INDEX_META_NAME holds
+the size and modification time of the billings file it belongs to and the number of sessions, and the bitsets are
+split into chunks of INDEX_CHUNK_SESSIONS sessions, one JSON file per chunk with the (non-empty) bitsets in hex.
+writebillings sets the bits of a session whenever it writes one, which only rewrites the small meta file and the
+chunk of that session, however many sessions and names there are. If the stamp does not match (manual edit, 'undo',
+...), the index is rebuilt from a SessionTable the next time it is queried.
+"""
+
+INDEX_KINDS = ["labels", "projects"]
+INDEX_META_NAME = "index.json"
+INDEX_CHUNK_SESSIONS = 1024
+
+
+def _get_chunk_path(client, chunk):
+    return os.path.join(client.session_index_filepath, "chunk_{}.json".format(chunk))
+
+
+def _read_json(path):
+    """
+    :return: Contents of a JSON file, None if it does not exist or cannot be read
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _read_chunk(client, chunk):
+    """
+    :return: {"labels": {name: int bitset}, "projects": ...} of a chunk, with bit 0 for its first session
+    """
+    stored = _read_json(_get_chunk_path(client, chunk)) or {}
+    return {kind: {name: int(bits, 16) for name, bits in stored.get(kind, {}).items()} for kind in INDEX_KINDS}
+
+
+def _write_chunk(client, chunk, bitsets):
+    _write_json(_get_chunk_path(client, chunk),
+                {kind: {name: format(bits, 'x') for name, bits in bitsets[kind].items() if bits} for kind in INDEX_KINDS})
+
+
+def _read_meta(client):
+    meta = _read_json(os.path.join(client.session_index_filepath, INDEX_META_NAME))
+    if meta is None or "stamp" not in meta or "sessions" not in meta:
+        return None
+    meta["stamp"] = tuple(meta["stamp"])
+    return meta
+
+
+def _write_meta(client, meta):
+    _write_json(os.path.join(client.session_index_filepath, INDEX_META_NAME), dict(meta, stamp=list(meta["stamp"])))
+
+
+def read_session_index(client):
+    """
+    :return: Index as stored ({"stamp", "sessions", "labels", "projects"} with int bitsets over all sessions),
+        None if there is none
+    """
+    meta = _read_meta(client)
+    if meta is None:
+        return None
+    index = dict(meta, labels={}, projects={})
+    for chunk in range((meta["sessions"] + INDEX_CHUNK_SESSIONS - 1) // INDEX_CHUNK_SESSIONS):
+        shift = chunk * INDEX_CHUNK_SESSIONS
+        for kind, bitsets in _read_chunk(client, chunk).items():
+            for name, bits in bitsets.items():
+                index[kind][name] = index[kind].get(name, 0) | (bits << shift)
+    return index
+
+
+def write_session_index(client, index):
+    """
+    Write a complete index (all chunks, then the meta file)
+    """
+    os.makedirs(client.session_index_filepath, exist_ok=True)
+    chunks = (index["sessions"] + INDEX_CHUNK_SESSIONS - 1) // INDEX_CHUNK_SESSIONS
+    mask = (1 << INDEX_CHUNK_SESSIONS) - 1
+    for chunk in range(chunks):
+        shift = chunk * INDEX_CHUNK_SESSIONS
+        _write_chunk(client, chunk, {kind: {name: (bits >> shift) & mask for name, bits in index[kind].items()} for kind in INDEX_KINDS})
+    while os.path.exists(_get_chunk_path(client, chunks)):  # chunks of sessions that are gone
+        os.remove(_get_chunk_path(client, chunks))
+        chunks += 1
+    _write_meta(client, {"stamp": index["stamp"], "sessions": index["sessions"]})
+    if os.path.exists(client.session_index_filepath + ".json"):  # single file index of earlier versions
+        os.remove(client.session_index_filepath + ".json")
+
+
+def update_session_index(client, billings_path, stamp_before, entry, replace_last):
+    """
+    Set the bits of a session after it was written to the billings file.
+    Leaves the index alone if it did not match the billings file before the change (it is rebuilt when queried).
+    :param stamp_before: get_file_stamp of the billings file before the change
+    :param entry: csv_entry of the written session
+    :param replace_last: The session replaced the last session instead of being appended
+    """
+    meta = _read_meta(client)
+    if meta is None or meta["stamp"] != stamp_before:
+        return
+
+    row = meta["sessions"] - 1 if replace_last else meta["sessions"]
+    if row < 0:
+        return
+    chunk, bit = divmod(row, INDEX_CHUNK_SESSIONS)
+    bitsets = _read_chunk(client, chunk)
+    if replace_last:
+        for kind in INDEX_KINDS:
+            for name in bitsets[kind]:
+                bitsets[kind][name] &= ~(1 << bit)
+    for kind, names in zip(INDEX_KINDS, [entry.labels, entry.projects]):
+        for name in set(names.split(set_delim)):
+            bitsets[kind][name] = bitsets[kind].get(name, 0) | (1 << bit)
+
+    _write_chunk(client, chunk, bitsets)  # before the meta file, an interrupted update leaves a stale stamp
+    _write_meta(client, {"stamp": get_file_stamp(billings_path), "sessions": row + 1})
+
+
+def build_session_index(sessions, billings_stamp):
+    """
+    :param sessions: SessionTable of the active billings file
+    """
+    import numpy as np
+
+    index = {"stamp": billings_stamp, "sessions": len(sessions)}
+    for kind in INDEX_KINDS:
+        names, sets = (sessions.label_names, sessions.label_sets) if kind == "labels" else (sessions.project_names, sessions.project_sets)
+        index[kind] = {}
+        for name_id, name in enumerate(names):
+            mask = np.isin(sessions.sessions[kind], [k for k, s in enumerate(sets) if name_id in s])
+            index[kind][name] = int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+    return index
+
+
+def load_session_index(client, sessions, rebuild=False):
+    """
+    Get the index of the active sessions, rebuilding it from the SessionTable if it is out of date.
+    The index is compared with (and a rebuilt index stored with) the stamp taken before the sessions were read
+    (SessionTable.stamp), so an index built from sessions that changed while being read is rebuilt the next time.
+    """
+    index = None if rebuild else read_session_index(client)
+    if index is None or index["stamp"] != sessions.stamp or index["sessions"] != len(sessions):
+        index = build_session_index(sessions, sessions.stamp)
+        write_session_index(client, index)
+    return index
+
+
+def select_sessions(index, labels=(), projects=()):
+    """
+    :return: Bitset of the sessions that have all of the given labels and all of the given projects
+    """
+    selected = (1 << index["sessions"]) - 1
+    for kind, names in zip(INDEX_KINDS, [labels, projects]):
+        for name in names:
+            selected &= index[kind].get(name, 0)
+    return selected
+
+
+def bits_to_mask(bits, length):
+    """
+    :return: numpy boolean array with the bits of a bitset
+    """
+    import numpy as np
+    data = np.frombuffer(bits.to_bytes((length + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(data, bitorder='little')[:length].astype(bool)
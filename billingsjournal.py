@@ -0,0 +1,110 @@
+import json
+from datetime import datetime
+
+from billingsconstants import *
+from billingsstorage import *
+
+"""
+Change journal for the billings files.
+
+Every change made by 'start', 'end' and 'reset' touches only the last session, so the journal stores one small
+undo entry per command (the position of the session, i.e. its byte offset in the .csv file or its row id in the
+database, and its line before and after the change) instead of copying the whole file.
+Once the journal grows past JOURNAL_COMPACTION_BYTES, the billings file is copied to the backup file as a snapshot
+and the journal starts over, so it only ever covers the changes made since the last snapshot.
+"""
+
+JOURNAL_COMPACTION_BYTES = 64 * 1024
+
+
+def compact_journal_if_needed(client):
+    """
+    Take a snapshot of the billings file and clear the journal if the journal has grown too large.
+    Call this before making a change, so the snapshot holds the state the new journal starts from.
+    """
+    journal_path = client.billings_journal_filepath
+    if not os.path.exists(journal_path) or os.path.getsize(journal_path) > JOURNAL_COMPACTION_BYTES:
+        compact_journal(client)
+
+
+def compact_journal(client):
+    get_storage(client).snapshot()
+    with open(client.billings_journal_filepath, 'w'):
+        pass
+
+
+def record_change(client, time_string, mode, offset, before, after):
+    """
+    Append an undo entry to the journal.
+    :param time_string: Time of the command in time_format
+    :param offset: Position of the changed session (see billingsstorage)
+    :param before: Line at offset before the change, None if the line was appended
+    :param after: Line at offset after the change
+    """
+    entry = {"time": time_string, "mode": mode, "offset": offset, "before": before, "after": after}
+    with open(client.billings_journal_filepath, 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+        sync_file(f, client.billings_journal_filepath)
+
+
+def read_journal(client):
+    """
+    :return: List of (byte offset in the journal, entry), oldest entry first
+    """
+    entries = []
+    if not os.path.exists(client.billings_journal_filepath):
+        return entries
+
+    with open(client.billings_journal_filepath, 'rb') as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                entries.append((offset, json.loads(line)))
+            offset += len(line)
+    return entries
+
+
+def _undo_entry(client, journal_offset, entry):
+    storage = get_storage(client)
+    position, last_entry = storage.read_last()
+    if position != entry["offset"] or last_entry is None or last_entry.csv_format() != entry["after"]:
+        raise RuntimeError("The end of the billings file does not match the journal (was it edited by hand?). "
+                           "Restore the snapshot at {} manually if needed.".format(storage.snapshot_path))
+
+    if entry["before"] is None:
+        storage.remove_last()
+    else:
+        storage.replace_last(parse_csv_line(entry["before"]))
+
+    with open(client.billings_journal_filepath, 'r+b') as f:
+        f.truncate(journal_offset)
+
+    print("Undid '{}' from {}".format(entry["mode"], entry["time"]))
+
+
+def undo_last_change(client):
+    entries = read_journal(client)
+    if len(entries) == 0:
+        raise RuntimeError("No changes to undo (the journal is empty, the last snapshot is at {})".format(get_storage(client).snapshot_path))
+
+    _undo_entry(client, *entries[-1])
+
+
+def restore_to(client, to_time_string):
+    """
+    Undo all journaled changes made after the given time.
+    :param to_time_string: Time in time_format
+    """
+    to_time = datetime.strptime(to_time_string, time_format)
+    entries = read_journal(client)
+
+    undone = 0
+    for journal_offset, entry in reversed(entries):
+        if datetime.strptime(entry["time"], time_format) <= to_time:
+            break
+        _undo_entry(client, journal_offset, entry)
+        undone += 1
+
+    if undone == len(entries) and undone > 0:
+        print("Reached the beginning of the journal, older changes are only contained in the snapshot at {}".format(get_storage(client).snapshot_path))
+    print("Restored the billings file to {} ({} change{} undone)".format(to_time_string, undone, "" if undone == 1 else "s"))
@@ -0,0 +1,104 @@
+import os
+import sys
+from contextlib import contextmanager
+
+from billingsconstants import *
+
+"""
+Locking and durable commits for concurrent writebillings commands.
+
+Every command that may change files in the financial folder holds an advisory lock on a lock file there for its whole
+read-modify-write cycle (fcntl.flock, msvcrt.locking on Windows), so commands started at the same time run one after
+another instead of overwriting each other's sessions. The lock is re-entrant within a process.
+
+Written files are flushed to disk with fsync before the lock is given up. Inside group_commit (used by the daemon for
+commands that arrive within a short window), the fsyncs are deferred and done once per file for the whole group.
+"""
+
+LOCK_FILE_PATH = os.path.join(FINANCIAL_DIR, LOCK_FILE_NAME)
+
+_lock_file = None
+_lock_depth = 0
+_deferred_syncs = None  # paths to fsync at the end of the open group commit
+
+
+def _lock(f):
+    if sys.platform == "win32":
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # gives up after 10 seconds
+                return
+            except OSError:
+                continue
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock(f):
+    if sys.platform == "win32":
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def billings_lock(path=LOCK_FILE_PATH):
+    """
+    Hold the lock of the financial folder, waiting for other processes to give it up first
+    """
+    global _lock_file, _lock_depth
+    if _lock_depth == 0:
+        f = open(path, 'a+b')
+        try:
+            _lock(f)
+        except BaseException:
+            f.close()
+            raise
+        _lock_file = f
+    _lock_depth += 1
+    try:
+        yield
+    finally:
+        _lock_depth -= 1
+        if _lock_depth == 0:
+            _unlock(_lock_file)
+            _lock_file.close()
+            _lock_file = None
+
+
+def sync_file(f, path):
+    """
+    Flush a file that was written to disk, or at the end of the open group commit
+    :param f: Open file object of path
+    """
+    f.flush()
+    if _deferred_syncs is not None:
+        _deferred_syncs.add(path)
+    else:
+        os.fsync(f.fileno())
+
+
+@contextmanager
+def group_commit():
+    """
+    Defer the fsyncs of sync_file until the end of the with-block, then sync every written file once
+    """
+    global _deferred_syncs
+    outer = _deferred_syncs is not None
+    if not outer:
+        _deferred_syncs = set()
+    try:
+        yield
+    finally:
+        if not outer:
+            paths, _deferred_syncs = _deferred_syncs, None
+            for path in paths:
+                if os.path.exists(path):
+                    with open(path, 'r+b') as f:
+                        os.fsync(f.fileno())
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from billingsconstants import *
+from billingsstorage import replace_hidden_file
+
+"""
+Pause ledger of the open session.
+
+Every 'pause'/'unpause' adds a line 'paused at;resumed at;' (to the second) to the client's pause file. When the
+session is ended, the sum of all pauses is taken off the session at once, so several pauses within one session
+are subtracted exactly instead of being rounded to whole minutes one by one.
+The ledger is kept until the next session is started, so an 'end' that is taken back with 'undo' can be repeated.
+"""
+
+PAUSE_TIME_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+
+def _parse_pause_time(time_string):
+    try:
+        return datetime.strptime(time_string, PAUSE_TIME_FORMAT)
+    except ValueError:
+        return datetime.strptime(time_string, time_format)  # pause files written by older versions
+
+
+def read_pause_ledger(path):
+    """
+    :return: List of [paused at, resumed at] (resumed at is None while paused)
+    """
+    ledger = []
+    if not os.path.exists(path):
+        return ledger
+
+    with open(path, 'r') as f:
+        for line in f.readlines():
+            if line.strip() == "":
+                continue
+            values = (line.strip().split(csv_delim) + ["", ""])[:2]
+            ledger.append([_parse_pause_time(values[0]), _parse_pause_time(values[1]) if values[1] else None])
+    return ledger
+
+
+def write_pause_ledger(path, ledger):
+    with open(path + ".tmp", 'w') as f:
+        for paused, resumed in ledger:
+            f.write(paused.strftime(PAUSE_TIME_FORMAT) + csv_delim + (resumed.strftime(PAUSE_TIME_FORMAT) if resumed else "") + csv_delim + "\n")
+    replace_hidden_file(path + ".tmp", path)
+
+
+def is_paused(ledger):
+    return len(ledger) > 0 and ledger[-1][1] is None
+
+
+def get_paused_time(ledger):
+    """
+    :return: Total length of all finished pauses as a timedelta
+    """
+    return sum((resumed - paused for paused, resumed in ledger if resumed is not None), timedelta())
+
+
+def remove_pause_ledger(path):
+    if os.path.exists(path):
+        os.remove(path)
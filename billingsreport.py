@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from billingsconstants import *
+from billingshistory import find_history_files
+from billingssessions import MINUTES_PER_DAY, MISSING_MINUTES, MISSING_TIME, SessionTable
+from billingsstorage import get_storage
+
+"""
+Period reports (drawbillings --report) over the active billings file and the whole history of clients.
+
+All sessions of a client are read into one SessionTable. Every session then gets the index of its week, month or year,
+and the sessions, minutes and the minutes of every label (and project) set are added up for all periods at once with
+bincount over (period, set) pairs. The minutes of a set are split evenly between its names, like in the pie charts.
+Billings are converted to € with CONVERSIONS_TO_EUR.
+"""
+
+REPORT_PERIODS = ["week", "month", "year"]
+READ_COLUMNS = ["Starting time", "Labels", "Projects", "Ending time", "Minutes"]
+ALL_CLIENTS = "All clients"
+
+
+def load_all_sessions(client, columns=READ_COLUMNS):
+    """
+    Read the active sessions and the sessions of every history file of a client into one SessionTable
+    :param columns: Columns to read (add "Description" to keep the descriptions)
+    """
+    storage = get_storage(client)
+    frames = []
+    if client.storage == "sqlite":  # history was migrated into the database
+        frames.append(storage.read_history_frame(columns))
+    else:
+        for path in find_history_files(client):
+            with open(path, 'r') as f:
+                frames.append(pd.read_csv(f, sep=csv_delim, usecols=columns))
+    if storage.exists():
+        frames.append(storage.read_frame(columns=columns))
+    frames = [frame for frame in frames if len(frame)]
+    return SessionTable.from_frame(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns))
+
+
+def get_periods(epoch_minutes, period):
+    """
+    :param period: One of REPORT_PERIODS (weeks start on Mondays)
+    :return: (index of the period of every time, first day of every period as days since the epoch, ascending)
+    """
+    days = epoch_minutes // MINUTES_PER_DAY
+    if period == "week":
+        first_days = days - (days + 3) % 7  # 1970-01-01 was a Thursday
+    else:
+        unit = 'datetime64[M]' if period == "month" else 'datetime64[Y]'
+        first_days = days.astype('datetime64[D]').astype(unit).astype('datetime64[D]').astype(np.int64)
+    first_days, index = np.unique(first_days, return_inverse=True)
+    return index, first_days
+
+
+def format_period(first_day, period):
+    day = np.datetime64(int(first_day), 'D').astype(object)
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return "{}-W{:02d}".format(year, week)
+    return day.strftime("%Y-%m" if period == "month" else "%Y")
+
+
+def split_minutes(period_index, period_count, set_ids, names, sets, minutes):
+    """
+    Add up the minutes of every name (label or project) in every period, splitting the minutes of a session evenly
+    between the names of its set
+    :return: Array of minutes with shape (periods, names)
+    """
+    per_set = np.bincount(period_index * len(sets) + set_ids, weights=minutes,
+                          minlength=period_count * len(sets)).reshape(period_count, len(sets))
+    shares = np.zeros((len(sets), len(names)))
+    for set_index, name_ids in enumerate(sets):
+        np.add.at(shares[set_index], list(name_ids), 1 / len(name_ids))
+    return per_set @ shares
+
+
+def get_client_report(client, sessions, period, since=None, until=None):
+    """
+    :param sessions: SessionTable with all sessions of the client (see load_all_sessions)
+    :param since: Only count sessions started at or after this time (epoch minutes)
+    :param until: Only count sessions started before this time (epoch minutes)
+    :return: List of report rows, one per period with finished sessions
+    """
+    data = sessions.sessions
+    counted = (data["start"] != MISSING_TIME) & (data["minutes"] != MISSING_MINUTES)
+    if since is not None:
+        counted &= data["start"] >= since
+    if until is not None:
+        counted &= data["start"] < until
+    data = data[counted]
+    if len(data) == 0:
+        return []
+
+    index, first_days = get_periods(data["start"], period)
+    minutes = data["minutes"].astype(float)
+    session_counts = np.bincount(index, minlength=len(first_days))
+    period_minutes = np.bincount(index, weights=minutes, minlength=len(first_days))
+    label_minutes = split_minutes(index, len(first_days), data["labels"], sessions.label_names, sessions.label_sets, minutes)
+    project_minutes = split_minutes(index, len(first_days), data["projects"], sessions.project_names, sessions.project_sets, minutes)
+
+    rows = []
+    for i, first_day in enumerate(first_days):
+        billing = period_minutes[i] / 60 * client.hourly_wage
+        rows.append({"Client": client.name, "Period": format_period(first_day, period), "first_day": first_day,
+                     "Sessions": int(session_counts[i]), "Minutes": period_minutes[i],
+                     "Billing": billing, "Currency": client.currency_symbol,
+                     "Billing (€)": billing * CONVERSIONS_TO_EUR[client.currency_symbol],
+                     "Labels": dict(zip(sessions.label_names, label_minutes[i])),
+                     "Projects": dict(zip(sessions.project_names, project_minutes[i]))})
+    return rows
+
+
+def _add_totals(rows):
+    """
+    :return: One row per period with the sessions, minutes and billing (in €) of all clients
+    """
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row["first_day"], {"Client": ALL_CLIENTS, "Period": row["Period"], "first_day": row["first_day"],
+                                                     "Sessions": 0, "Minutes": 0., "Billing": 0., "Currency": "€",
+                                                     "Billing (€)": 0., "Labels": {}, "Projects": {}})
+        for column in ["Sessions", "Minutes", "Billing (€)"]:
+            total[column] += row[column]
+        total["Billing"] = total["Billing (€)"]
+        for column in ["Labels", "Projects"]:
+            for name, minutes in row[column].items():
+                total[column][name] = total[column].get(name, 0) + minutes
+    return [totals[first_day] for first_day in sorted(totals)]
+
+
+def format_breakdown(minutes_per_name):
+    """
+    :return: Hours per name, most worked first, e.g. "CODE 12.5h, COMM 3.0h"
+    """
+    names = sorted((name for name, minutes in minutes_per_name.items() if minutes > 0), key=lambda n: -minutes_per_name[n])
+    return ", ".join("{} {}h".format(name, to_truncated_string(minutes_per_name[name] / 60)) for name in names)
+
+
+def build_report(clients, period, since=None, until=None):
+    """
+    Build the period report of the given clients (see the module docstring), with totals over all clients if
+    there are several
+    :return: DataFrame with one row per client and period
+    """
+    rows = []
+    for client in clients:
+        rows.extend(get_client_report(client, load_all_sessions(client), period, since, until))
+    if len(clients) > 1:
+        rows.extend(_add_totals(rows))
+
+    report = pd.DataFrame(rows, columns=["Client", "Period", "first_day", "Sessions", "Minutes", "Billing", "Currency",
+                                         "Billing (€)", "Labels", "Projects"])
+    report.insert(report.columns.get_loc("Minutes"), "Hours", (report["Minutes"] / 60).round(2))
+    report["Billing"] = report["Billing"].round(2)
+    report["Billing (€)"] = report["Billing (€)"].round(2)
+    report["Labels"] = report["Labels"].map(format_breakdown)
+    report["Projects"] = report["Projects"].map(format_breakdown)
+    return report.drop(columns=["first_day", "Minutes"])
@@ -0,0 +1,189 @@
+import calendar
+import json
+from datetime import date, datetime
+from functools import lru_cache
+
+from billingsconstants import *
+from billingsstorage import *
+from billingsjournal import compact_journal
+
+"""
+Rollover of the active billings file into the history folder at the client's due date.
+
+The billing period of a session ends on the first due date (the client's due_date-th day of a month, or the last day of
+shorter months) after the day it started on. Once a command is run on or after the due date, every session of a
+finished period is moved from the active file into '<client>_history/<YYYY-MM-DD of the due date>/billings.csv' and the
+active file starts over with the sessions of the current period.
+Next to each archived file, a summary (HISTORY_SUMMARY_NAME) with the minutes per label, project and day is written, so
+drawbillings does not have to parse archived sessions again as long as the archived file is not changed.
+
+The check whether a rollover is due only reads the first session of the active file.
+Only clients with .csv storage are rolled over.
+"""
+
+
+def get_due_day(due_date, year, month):
+    return date(year, month, min(due_date, calendar.monthrange(year, month)[1]))
+
+
+def get_next_due_day(due_date, day):
+    """
+    :return: First due day after the given day (the end of the billing period the day belongs to)
+    """
+    due_day = get_due_day(due_date, day.year, day.month)
+    if due_day > day:
+        return due_day
+    year, month = (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+    return get_due_day(due_date, year, month)
+
+
+def _read_first_day(path):
+    """
+    :return: Day of the first session of a billings file whose starting time can be read, None if there is none
+    """
+    with open(path, 'r') as f:
+        f.readline()
+        for line in f:
+            entry = parse_session_line(line.rstrip("\r\n")) if line.strip() else None
+            if entry is None:
+                continue
+            try:
+                return _session_day(entry)
+            except ValueError:  # malformed line, stays in the active file ('check' reports it)
+                pass
+    return None
+
+
+@lru_cache(maxsize=None)
+def _parse_day(day_string):
+    return datetime.strptime(day_string, time_format_daily).date()
+
+
+def _session_day(entry):
+    return _parse_day(entry.start_date[:10])  # sessions of one day share the parsed date
+
+
+def is_rollover_due(client, today):
+    if client.storage != "csv" or not os.path.exists(client.billings_filepath):
+        return False
+    first_day = _read_first_day(client.billings_filepath)
+    return first_day is not None and get_next_due_day(client.due_date, first_day) <= today
+
+
+def _add_split(totals, names, minutes):
+    names = names.split(set_delim)
+    for name in names:
+        totals[name] = totals.get(name, 0) + minutes / len(names)
+
+
+def summarize_sessions(entries):
+    """
+    :return: Summary of archived sessions: number of sessions, total minutes and minutes per label, project
+        (split evenly like in drawbillings) and day
+    """
+    summary = {"sessions": len(entries), "minutes": 0, "labels": {}, "projects": {}, "days": {}}
+    for entry in entries:
+        try:
+            minutes = float(entry.minutes)
+        except ValueError:
+            minutes = 0.
+        summary["minutes"] += minutes
+        _add_split(summary["labels"], entry.labels, minutes)
+        _add_split(summary["projects"], entry.projects, minutes)
+        day = entry.start_date[:10]
+        summary["days"][day] = summary["days"].get(day, 0) + minutes
+    return summary
+
+
+def write_summary(archive_path, entries):
+    summary = summarize_sessions(entries)
+    stat = os.stat(archive_path)
+    summary["source_size"], summary["source_mtime_ns"] = stat.st_size, stat.st_mtime_ns
+    with open(os.path.join(os.path.dirname(archive_path), HISTORY_SUMMARY_NAME), 'w') as f:
+        json.dump(summary, f, indent=1, ensure_ascii=False)
+    return summary
+
+
+def read_summary(archive_path):
+    """
+    :return: Summary written next to an archived billings file, None if there is none or the file changed since
+    """
+    summary_path = os.path.join(os.path.dirname(archive_path), HISTORY_SUMMARY_NAME)
+    if not os.path.exists(summary_path):
+        return None
+    try:
+        with open(summary_path, 'r') as f:
+            summary = json.load(f)
+    except ValueError:
+        return None
+    stat = os.stat(archive_path)
+    if summary.get("source_size") != stat.st_size or summary.get("source_mtime_ns") != stat.st_mtime_ns:
+        return None
+    return summary
+
+
+def _get_archive_folder(client, due_day):
+    folder = os.path.join(client.history_folder, due_day.strftime("%Y-%m-%d"))
+    suffix = 1
+    while os.path.exists(folder):  # rolled over before, e.g. after sessions were added to a past period by hand
+        suffix += 1
+        folder = os.path.join(client.history_folder, due_day.strftime("%Y-%m-%d") + "_" + str(suffix))
+    return folder
+
+
+def rollover(client, today):
+    """
+    Move the sessions of all finished billing periods from the active file into the history folder.
+    Open sessions and lines that cannot be read (wrong number of fields or an unreadable time) stay in the active file.
+    :return: List of the archived billings files
+    """
+    with open(client.billings_filepath, 'r') as f:
+        lines = [l.rstrip("\r\n") for l in f.readlines()]
+    header = lines[0] if lines else header_string
+
+    periods = {}
+    remaining = []
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        entry = parse_session_line(line)
+        try:
+            due_day = get_next_due_day(client.due_date, _session_day(entry)) if entry is not None else None
+        except ValueError:
+            due_day = None
+        if due_day is not None and due_day <= today and entry.end_date.strip():  # open sessions stay
+            periods.setdefault(due_day, []).append((line, entry))
+        else:
+            remaining.append(line)
+
+    archived = []
+    messages = []
+    for due_day in sorted(periods):
+        archive_path = os.path.join(_get_archive_folder(client, due_day), client.past_billings_filename)
+        os.makedirs(os.path.dirname(archive_path))
+        rewrite_atomic(archive_path, [header] + [line for line, _ in periods[due_day]])
+        summary = write_summary(archive_path, [entry for _, entry in periods[due_day]])
+        archived.append(archive_path)
+
+        minutes = summary["minutes"]
+        messages.append("Rolled over {} sessions of the period ending {} ({} hours, {}) into {}".format(
+            len(periods[due_day]), due_day.strftime(time_format_daily), to_truncated_string(minutes / 60),
+            client.currency_symbol + to_truncated_string(minutes / 60 * client.hourly_wage), archive_path))
+
+    if archived:
+        rewrite_atomic(client.billings_filepath, [header] + remaining)
+        compact_journal(client)  # undo must not bring the archived sessions back into the active file
+    for message in messages:  # only once the active file was rewritten
+        print(message)
+    return archived
+
+
+def rollover_if_due(client, today=None):
+    """
+    Roll over the active file if a due date has passed since its first session (see the module docstring).
+    :return: List of the archived billings files (empty if nothing was due)
+    """
+    today = today or date.today()
+    if not is_rollover_due(client, today):
+        return []
+    return rollover(client, today)
@@ -0,0 +1,152 @@
+import struct
+from array import array
+from datetime import datetime, date
+
+from billingsconstants import *
+
+"""
+Per-client rollup of the minutes worked on each day (active billings file and history).
+
+The rollup file holds a header and one int64 per calendar day, starting at the first day with a session. Whenever
+writebillings closes or resets a session, only the slot of that day is rewritten in place. The header stores the
+size and modification time of the billings file (and the modification time of the history cache) the rollup
+belongs to; if they do not match, e.g. after a manual edit or an 'undo', drawbillings rebuilds the rollup.
+"""
+
+# magic, ordinal of the first day, size and mtime (ns) of the billings file, mtime (ns) of the history cache
+ROLLUP_HEADER = struct.Struct("<8sqqqq")
+ROLLUP_MAGIC = b"BILLDAY1"
+
+
+def get_file_stamp(path):
+    """
+    :return: (size, modification time in ns) of a file, (0, 0) if it does not exist
+    """
+    if not os.path.exists(path):
+        return 0, 0
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def get_day_ordinal(time_string):
+    """
+    :param time_string: Time in time_format (or time_format_daily)
+    """
+    return datetime.strptime(time_string[:10], time_format_daily).toordinal()
+
+
+def read_rollup_header(client):
+    """
+    :return: (first day ordinal, billings file stamp, history cache mtime), None if there is no valid rollup
+    """
+    if not os.path.exists(client.daily_rollup_filepath):
+        return None
+    with open(client.daily_rollup_filepath, 'rb') as f:
+        data = f.read(ROLLUP_HEADER.size)
+    if len(data) < ROLLUP_HEADER.size:
+        return None
+    magic, first_ordinal, size, mtime, history_mtime = ROLLUP_HEADER.unpack(data)
+    if magic != ROLLUP_MAGIC:
+        return None
+    return first_ordinal, (size, mtime), history_mtime
+
+
+def write_rollup(client, first_ordinal, billings_stamp, history_mtime, minutes):
+    """
+    :param minutes: Sequence of minutes per day, starting at first_ordinal
+    """
+    temp_path = client.daily_rollup_filepath + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(ROLLUP_HEADER.pack(ROLLUP_MAGIC, first_ordinal, billings_stamp[0], billings_stamp[1], history_mtime))
+        array('q', [int(m) for m in minutes]).tofile(f)
+    os.replace(temp_path, client.daily_rollup_filepath)
+
+
+def update_daily_rollup(client, billings_path, stamp_before, start_date, delta_minutes):
+    """
+    Add minutes to the day of a session after the billings file was changed.
+    Leaves the rollup alone if it did not match the billings file before the change (it is rebuilt when drawing).
+    :param stamp_before: get_file_stamp of the billings file before the change
+    :param start_date: Starting time of the changed session
+    :param delta_minutes: Change of the session's minutes
+    """
+    header = read_rollup_header(client)
+    if header is None or header[1] != stamp_before:
+        return
+    first_ordinal, _, history_mtime = header
+    billings_stamp = get_file_stamp(billings_path)
+
+    index = get_day_ordinal(start_date) - first_ordinal if delta_minutes != 0 else 0
+    item_size = array('q').itemsize
+    rollup_days = (os.path.getsize(client.daily_rollup_filepath) - ROLLUP_HEADER.size) // item_size
+
+    if not 0 <= index < rollup_days:  # a day outside of the rollup, rewrite it (it is small)
+        minutes = array('q')
+        with open(client.daily_rollup_filepath, 'rb') as f:
+            f.seek(ROLLUP_HEADER.size)
+            minutes.fromfile(f, rollup_days)
+        minutes = list(minutes)
+        if index < 0:
+            minutes = [0] * (-index) + minutes
+            first_ordinal += index
+            index = 0
+        minutes += [0] * (index + 1 - len(minutes))
+        minutes[index] += delta_minutes
+        write_rollup(client, first_ordinal, billings_stamp, history_mtime, minutes)
+        return
+
+    with open(client.daily_rollup_filepath, 'r+b') as f:
+        if delta_minutes != 0:
+            f.seek(ROLLUP_HEADER.size + index * item_size)
+            value = array('q')
+            value.fromfile(f, 1)
+            value[0] += delta_minutes
+            f.seek(ROLLUP_HEADER.size + index * item_size)
+            value.tofile(f)
+        f.seek(0)
+        f.write(ROLLUP_HEADER.pack(ROLLUP_MAGIC, first_ordinal, billings_stamp[0], billings_stamp[1], history_mtime))
+
+
+def load_daily_rollup(client, starting_time_columns, billings_stamp, rebuild=False):
+    """
+    Get the minutes per day, rebuilding the rollup from the given columns if it is out of date.
+    :param starting_time_columns: List of (starting time, minutes) columns of the active file and the history,
+        starting times as strings or as epoch minutes (see billingssessions)
+    :param billings_stamp: get_file_stamp of the billings file taken before the columns were read from it (see
+        SessionTable.stamp). A rebuilt rollup is stored with this stamp, so if the file was changed in the meantime,
+        the rollup does not match it and is rebuilt the next time.
+    :return: (ordinal of the first day, numpy array of minutes per day)
+    """
+    import numpy as np
+    import pandas as pd
+    from billingssessions import MISSING_TIME, EPOCH_ORDINAL, get_day_ordinals
+
+    history_mtime = get_file_stamp(client.history_cache_filepath)[1]
+    header = read_rollup_header(client)
+    if not rebuild and header is not None and header[1] == billings_stamp and header[2] == history_mtime:
+        return header[0], np.fromfile(client.daily_rollup_filepath, dtype='<i8', offset=ROLLUP_HEADER.size)
+
+    ordinals, minutes = [], []
+    for start, column_minutes in starting_time_columns:
+        start = np.asarray(start)
+        if np.issubdtype(start.dtype, np.integer):  # epoch minutes of a SessionTable
+            valid = start != MISSING_TIME
+            days = get_day_ordinals(start)
+        else:
+            parsed = pd.to_datetime(pd.Series(start, dtype=str).str[:10], format=time_format_daily, errors='coerce')
+            valid = parsed.notna().to_numpy()
+            days = parsed.to_numpy().astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+        column_minutes = np.asarray(column_minutes, dtype=float)
+        valid = valid & ~np.isnan(column_minutes)
+        ordinals.append(days[valid])
+        minutes.append(column_minutes[valid])
+
+    ordinals = np.concatenate(ordinals) if ordinals else np.zeros(0, dtype=np.int64)
+    minutes = np.concatenate(minutes) if minutes else np.zeros(0)
+    if len(ordinals) == 0:
+        return date.today().toordinal(), np.zeros(0, dtype=np.int64)
+
+    first_ordinal = int(ordinals.min())
+    daily = np.bincount(ordinals - first_ordinal, weights=minutes).round().astype(np.int64)
+    write_rollup(client, first_ordinal, billings_stamp, history_mtime, daily)
+    return first_ordinal, daily
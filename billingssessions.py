@@ -0,0 +1,275 @@
+import mmap
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from billingsconstants import *
+from billingsrollup import get_file_stamp
+from billingsstorage import get_storage
+
+"""
+Compact in-memory model of a client's sessions.
+
+Sessions are held in one NumPy structured array instead of strings: starting and ending time as int64 minutes since
+1970-01-01 00:00 (local time, as written to the billings file), the minutes as int32 and the label and project sets
+as ids into interned vocabularies. Every distinct set string (e.g. "CODE,DOCS") is split only once, so all
+aggregations work on integer arrays.
+Times that cannot be parsed are stored as MISSING_TIME, the minutes of open sessions as MISSING_MINUTES.
+
+Files whose labels, projects and descriptions are not needed (the history) are read with map_time_columns, which
+takes the digits of the fixed-width times and the minutes straight from a memory map of the file.
+"""
+
+SESSION_DTYPE = np.dtype([("start", "<i8"), ("end", "<i8"), ("minutes", "<i4"), ("labels", "<i4"), ("projects", "<i4")])
+MISSING_TIME = np.iinfo(np.int64).min  # NaT as int64
+MISSING_MINUTES = -1
+MINUTES_PER_DAY = 24 * 60
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+TIME_WIDTH = len("dd.mm.YYYY HH:MM")
+TIME_DIGITS = np.array([0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15])  # positions of the digits in a time_format string
+TIME_SEPARATORS = (np.array([2, 5, 10, 13]), np.frombuffer(b".. :", dtype=np.uint8))
+MAX_MINUTES_DIGITS = 9
+
+
+def encode_times(time_strings):
+    """
+    :param time_strings: Times in time_format
+    :return: int64 array of minutes since the epoch, MISSING_TIME where a time cannot be parsed
+    """
+    strings = pd.Series(time_strings, dtype=str).fillna("")
+    # fixed-width times are read from their code points like in map_time_columns, the rest (e.g. "1.1.2001 9:05") by pandas
+    code_points = strings.to_numpy(dtype="U{}".format(TIME_WIDTH + 1))  # one more, so longer strings are not valid
+    lengths = np.char.str_len(code_points)
+    times = _decode_times(code_points.view(np.uint32), np.arange(len(strings)) * (TIME_WIDTH + 1), lengths)
+
+    rest = np.flatnonzero((times == MISSING_TIME) & (lengths > 0))
+    if len(rest):
+        parsed = pd.to_datetime(strings.iloc[rest], format=time_format, errors='coerce')
+        times[rest] = parsed.to_numpy().astype('datetime64[m]').astype(np.int64)
+    return times
+
+
+def format_times(epoch_minutes):
+    """
+    Reverse of encode_times (NaN where the time is missing, like an empty field read by pandas). The digits are written into a fixed-width byte array
+    (see TIME_DIGITS) instead of formatting every time on its own.
+    """
+    epoch_minutes = np.asarray(epoch_minutes, dtype=np.int64)
+    missing = epoch_minutes == MISSING_TIME
+    times = np.where(missing, 0, epoch_minutes)
+    days = (times // MINUTES_PER_DAY).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    fields = [(days - months.astype('datetime64[D]')).astype(np.int64) + 1, (months - years.astype('datetime64[M]')).astype(np.int64) + 1,
+              years.astype(np.int64) + 1970, times % MINUTES_PER_DAY // 60, times % 60]
+
+    digits = np.empty((len(times), len(TIME_DIGITS)), dtype=np.int64)
+    column = 0
+    for field, width in zip(fields, [2, 2, 4, 2, 2]):
+        for power in reversed(range(width)):
+            digits[:, column] = field // 10**power % 10
+            column += 1
+    chars = np.empty((len(times), TIME_WIDTH), dtype=np.uint8)
+    chars[:, TIME_DIGITS] = digits + ord("0")
+    chars[:, TIME_SEPARATORS[0]] = TIME_SEPARATORS[1]
+
+    formatted = chars.view("S{}".format(TIME_WIDTH)).ravel().astype(str).astype(object)
+    formatted[missing] = np.nan
+    return formatted.tolist()
+
+
+def get_day_ordinals(epoch_minutes):
+    """
+    :return: Proleptic Gregorian ordinals (like date.toordinal) of the days of the given times
+    """
+    return np.asarray(epoch_minutes, dtype=np.int64) // MINUTES_PER_DAY + EPOCH_ORDINAL
+
+
+def _decode_times(buffer, starts, lengths):
+    """
+    Read the times of time_format fields from a byte buffer without creating an object per field.
+    :param starts: Byte offset of each field
+    :param lengths: Length of each field
+    :return: int64 array of minutes since the epoch, MISSING_TIME where the field is not a valid time
+    """
+    valid = lengths == TIME_WIDTH
+    starts = np.where(valid, starts, 0)
+    if len(buffer) < TIME_WIDTH:
+        return np.full(len(starts), MISSING_TIME, dtype=np.int64)
+    starts = np.minimum(starts, len(buffer) - TIME_WIDTH)
+
+    digits = buffer[starts[:, None] + TIME_DIGITS].astype(np.int64) - ord("0")
+    valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+    valid &= (buffer[starts[:, None] + TIME_SEPARATORS[0]] == TIME_SEPARATORS[1]).all(axis=1)
+
+    day, month = digits[:, 0]*10 + digits[:, 1], digits[:, 2]*10 + digits[:, 3]
+    year = digits[:, 4]*1000 + digits[:, 5]*100 + digits[:, 6]*10 + digits[:, 7]
+    hour, minute = digits[:, 8]*10 + digits[:, 9], digits[:, 10]*10 + digits[:, 11]
+    valid &= (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60)
+
+    months = np.where(valid, (year - 1970)*12 + month - 1, 0)
+    first_days = months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    month_lengths = (months + 1).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) - first_days
+    valid &= (day >= 1) & (day <= month_lengths)
+
+    times = (first_days + day - 1) * MINUTES_PER_DAY + hour*60 + minute
+    return np.where(valid, times, MISSING_TIME)
+
+
+def _decode_minutes(buffer, starts, lengths):
+    """
+    Read the minutes fields from a byte buffer. Fields of whole minutes are read without creating an object per
+    field; only the rare other fields (decimals, written by hand) are parsed one by one.
+    :return: float array of minutes, NaN for empty or invalid fields
+    """
+    minutes = np.full(len(starts), np.nan)
+    width = min(MAX_MINUTES_DIGITS, int(lengths.max())) if len(lengths) else 0
+    if width == 0:
+        return minutes
+
+    positions = np.minimum(starts[:, None] + np.arange(width), len(buffer) - 1)
+    in_field = np.arange(width) < lengths[:, None]
+    digits = buffer[positions].astype(np.int64) - ord("0")
+    whole = (lengths > 0) & (lengths <= width) & (((digits >= 0) & (digits <= 9)) | ~in_field).all(axis=1)
+    powers = np.where(in_field, 10 ** np.maximum(lengths[:, None] - 1 - np.arange(width), 0), 0)
+    minutes[whole] = (np.where(in_field, digits, 0) * powers).sum(axis=1)[whole]
+
+    for row in np.flatnonzero(~whole & (lengths > 0)):
+        try:
+            minutes[row] = float(bytes(buffer[starts[row]:starts[row] + lengths[row]]))
+        except ValueError:
+            pass
+    return minutes
+
+
+def map_time_columns(path):
+    """
+    Read the 'Starting time', 'Ending time' and 'Minutes' columns of a billings file through a memory map, without
+    decoding the other columns. The starting time is the first field of a line, the ending time and the minutes are
+    the last two fields (before the closing delimiter).
+    :return: (starting time, ending time) as int64 arrays like encode_times, minutes as a float array (NaN if missing)
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            buffer = np.frombuffer(mapped, dtype=np.uint8)
+            try:
+                line_breaks = np.flatnonzero(buffer == ord("\n"))
+                starts = np.concatenate(([0], line_breaks + 1))[1:]  # without the header
+                ends = np.append(line_breaks[1:], len(buffer)) if len(line_breaks) else np.zeros(0, dtype=np.int64)
+                ends = ends - (buffer[np.maximum(ends - 1, 0)] == ord("\r"))  # Windows line breaks
+                keep = ends > starts
+                starts, ends = starts[keep], ends[keep]
+
+                delims = np.flatnonzero(buffer == ord(csv_delim))
+                closing = ends - (buffer[np.maximum(ends - 1, 0)] == ord(csv_delim))  # the closing delimiter is optional
+                first = np.searchsorted(delims, starts)  # delimiter after the starting time
+                last = np.searchsorted(delims, closing) - 1  # delimiter before the minutes
+                keep = last - first >= 4  # lines with less than six fields are skipped ('check' reports them)
+                starts, closing, first, last = starts[keep], closing[keep], first[keep], last[keep]
+
+                start_times = _decode_times(buffer, starts, delims[first] - starts)
+                end_starts = delims[last - 1] + 1
+                end_times = _decode_times(buffer, end_starts, delims[last] - end_starts)
+                minute_starts = delims[last] + 1
+                minutes = _decode_minutes(buffer, minute_starts, closing - minute_starts)
+            finally:
+                del buffer  # release the view before the memory map is closed
+    return start_times, end_times, minutes
+
+
+def intern_sets(set_strings, delim=set_delim):
+    """
+    Dictionary-encode a column of delimited sets. Missing sets (an empty field read as NaN) count as the default label.
+    :return: (int32 set id per row, vocabulary of names, list of sets as tuples of ids into the vocabulary)
+    """
+    set_ids, unique_sets = pd.factorize(pd.Series(set_strings, dtype=object).fillna(default_label_string).astype(str))  # in order of first appearance
+    names = {}
+    sets = [tuple(names.setdefault(name, len(names)) for name in s.split(delim)) for s in unique_sets]
+    return set_ids.astype(np.int32), list(names), sets
+
+
+class SessionTable:
+    """
+    Sessions of a client (see the module docstring).
+    The descriptions are only kept if they are asked for (see load_sessions), as a plain list.
+    stamp is the get_file_stamp of the billings file taken before it was read (None if not read by load_sessions), so
+    caches built from the sessions are not marked as matching a file that changed while it was being read.
+    """
+
+    def __init__(self, sessions, label_names, label_sets, project_names, project_sets, descriptions=None):
+        self.sessions = sessions
+        self.stamp = None
+        self.label_names = label_names
+        self.label_sets = label_sets
+        self.project_names = project_names
+        self.project_sets = project_sets
+        self.descriptions = descriptions
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        :param df: Billings data with the columns of header_string (the description is optional)
+        """
+        sessions = np.empty(len(df), dtype=SESSION_DTYPE)
+        sessions["start"] = encode_times(df["Starting time"])
+        sessions["end"] = encode_times(df["Ending time"])
+        minutes = pd.to_numeric(df["Minutes"], errors='coerce').to_numpy(dtype=float)
+        sessions["minutes"] = np.where(np.isnan(minutes), MISSING_MINUTES, np.round(np.nan_to_num(minutes)))
+        sessions["labels"], label_names, label_sets = intern_sets(df["Labels"])
+        sessions["projects"], project_names, project_sets = intern_sets(df["Projects"])
+        descriptions = df["Description"].tolist() if "Description" in df.columns else None
+        return cls(sessions, label_names, label_sets, project_names, project_sets, descriptions)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get_minutes(self):
+        """
+        :return: Minutes of every session as floats, NaN for open sessions
+        """
+        minutes = self.sessions["minutes"].astype(float)
+        minutes[self.sessions["minutes"] == MISSING_MINUTES] = np.nan
+        return minutes
+
+    def total_minutes(self):
+        minutes = self.sessions["minutes"]
+        return int(minutes[minutes != MISSING_MINUTES].sum(dtype=np.int64))
+
+    def minutes_per_name(self, column):
+        """
+        Add up the minutes for each label (or project). The minutes of a session are split evenly between the
+        names in its set, open sessions count with 0 minutes.
+        :param column: "labels" or "projects"
+        :return: Map from name to minutes, in order of first appearance
+        """
+        names, sets = (self.label_names, self.label_sets) if column == "labels" else (self.project_names, self.project_sets)
+        minutes = np.maximum(self.sessions["minutes"], 0)
+        per_set = np.bincount(self.sessions[column], weights=minutes, minlength=len(sets))
+        per_name = np.zeros(len(names))
+        for set_index, name_ids in enumerate(sets):
+            np.add.at(per_name, list(name_ids), per_set[set_index] / len(name_ids))
+        return dict(zip(names, per_name.tolist()))
+
+    def get_set_strings(self, column):
+        names, sets = (self.label_names, self.label_sets) if column == "labels" else (self.project_names, self.project_sets)
+        set_strings = np.array([set_delim.join(names[i] for i in s) for s in sets], dtype=object)
+        return set_strings[self.sessions[column]]
+
+
+def load_sessions(client, descriptions=False, window=None):
+    """
+    Read the active sessions of a client into a SessionTable
+    :param descriptions: Also keep the session descriptions
+    :param window: Only read the sessions in this TimeWindow (see billingsstorage.get_window)
+    """
+    columns = ["Starting time", "Labels", "Projects", "Ending time", "Minutes"]
+    if descriptions:
+        columns.insert(3, "Description")
+    storage = get_storage(client)
+    stamp = get_file_stamp(storage.path)  # before reading, a change while reading then shows as a different stamp
+    sessions = SessionTable.from_frame(storage.read_frame(columns=columns, window=window))
+    sessions.stamp = stamp
+    return sessions
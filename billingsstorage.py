@@ -0,0 +1,552 @@
+import ctypes
+import locale
+import os
+import shutil
+import sqlite3
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+from billingsconstants import *
+from billingslock import sync_file
+
+"""
+Storage of the billings sessions.
+
+Each client's sessions live either in a .csv billings file (CsvStorage, the default) or in an indexed SQLite
+database (SqliteStorage, set storage="sqlite" for the client). Both are used through the same methods, which
+exchange sessions as csv_entry objects; get_storage picks the right one for a client.
+
+Sessions are only ever added or changed at the end of the .csv file, so instead of reading and rewriting the whole file,
+the last line is located by reading backwards from the end and is then appended to or patched in place.
+Whenever the end of the file is not in the expected shape, the whole file is rewritten atomically instead.
+"""
+
+BILLINGS_ENCODING = locale.getpreferredencoding(False)  # same encoding open() uses in text mode
+TAIL_BLOCK_SIZE = 4096
+
+# offset: byte offset of the last line, end: byte offset right after its last character,
+# line: the last line (without line break), None for empty files, size: size of the file in bytes
+Tail = namedtuple("Tail", ["offset", "end", "line", "size"])
+
+# since/until: first and last start key (see get_start_key) to read, last: only read the last sessions; None for no limit
+TimeWindow = namedtuple("TimeWindow", ["since", "until", "last"])
+
+
+class csv_entry:
+    def __init__(self, start_date, labels, projects, description, end_date, minutes):
+        self.start_date, self.labels, self.projects, self.description, self.end_date, self.minutes = start_date, labels, \
+                                                                                projects, description, end_date, minutes
+
+    def csv_format(self, d=csv_delim, close_delim=True):
+        """
+        Turn a list of items into a csv-compatible line.
+        :return:
+        """
+        l = self.start_date + d + self.labels + d + self.projects + d + self.description + d + self.end_date + d + str(self.minutes) + (d if close_delim else "")
+
+        return l
+
+
+def parse_csv_line(line):
+    """
+    Turn a line of the billings file (with closing delimiter, without line break) into a csv_entry
+    """
+    return csv_entry(*line.split(csv_delim)[:-1])
+
+
+def parse_session_line(line):
+    """
+    Like parse_csv_line, but None for a line without the fields of a session (e.g. a ';' typed into a description or
+    a line that is still being written)
+    """
+    if len(line.split(csv_delim)) != len(header_string.split(csv_delim)):
+        return None
+    return parse_csv_line(line)
+
+
+def get_start_key(start_date):
+    """
+    Turn a time_format string into a sortable integer YYYYMMDDHHMM
+    """
+    return int(start_date[6:10] + start_date[3:5] + start_date[0:2] + start_date[11:13] + start_date[14:16])
+
+
+FILE_ATTRIBUTE_HIDDEN = 0x02
+
+
+def _set_hidden(path, hidden):
+    if sys.platform == "win32":
+        attributes = ctypes.windll.kernel32.GetFileAttributesW(path)
+        if attributes != -1:
+            attributes = attributes | FILE_ATTRIBUTE_HIDDEN if hidden else attributes & ~FILE_ATTRIBUTE_HIDDEN
+            ctypes.windll.kernel32.SetFileAttributesW(path, attributes)
+
+
+def hide_file(path):
+    """
+    Mark a file as hidden on Windows, does nothing on other platforms
+    """
+    _set_hidden(path, True)
+
+
+def read_tail(path):
+    """
+    Find the last non-empty line of a file by reading blocks backwards from its end.
+    :param path: Path of the billings file
+    :return: Tail of the file, the header is the only line if tail.offset == 0
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        pos = size
+        buffer = b""
+        while pos > 0:
+            step = min(TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            buffer = f.read(step) + buffer
+            stripped = buffer.rstrip()
+            line_break = stripped.rfind(b"\n")
+            if line_break >= 0 or (pos == 0 and stripped):
+                line = stripped[line_break+1:]
+                offset = pos + line_break + 1
+                return Tail(offset, offset + len(line), line.decode(BILLINGS_ENCODING), size)
+
+    return Tail(0, 0, None, size)
+
+
+def get_window(since=None, until=None, last=None):
+    """
+    :param since: First day to read (time_format_daily)
+    :param until: Last day to read (time_format_daily), including the whole day
+    :param last: Number of sessions to read at most, counting back from the end (of the days)
+    :return: TimeWindow, None if no limit was given
+    """
+    if since is None and until is None and last is None:
+        return None
+    to_key = lambda day, time: get_start_key(datetime.strptime(day, time_format_daily).strftime(time_format_daily) + " " + time)
+    return TimeWindow(to_key(since, "00:00") if since else None, to_key(until, "23:59") if until else None, last)
+
+
+def _line_key(line):
+    """
+    :return: Start key of a line, None for empty lines and lines that do not start with a time
+    """
+    try:
+        return get_start_key(line[:16].decode(BILLINGS_ENCODING)) if line.strip() else None
+    except ValueError:
+        return None
+
+
+def _find_line(f, lo, size, key, after):
+    """
+    Binary search on byte offsets for the first line with a start key >= key (> key if after).
+    Sessions are appended in chronological order, so only log(size) lines are read.
+    :param lo: Offset of the first line to consider
+    :return: Offset of the line, size if there is none
+    """
+    hi = size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        f.seek(mid - 1)
+        f.readline()  # skip to the first line starting at or after mid
+        line_key = _line_key(f.readline())
+        if line_key is None or (line_key > key if after else line_key >= key):
+            hi = mid
+        else:
+            lo = mid + 1
+    f.seek(lo - 1)
+    f.readline()
+    return f.tell()
+
+
+def _find_last_lines(f, lo, end, count):
+    """
+    Read blocks backwards from end to find the offset of the count-th last non-empty line before it
+    """
+    pos = end
+    buffer = b""
+    while pos > lo:
+        step = min(TAIL_BLOCK_SIZE, pos - lo)
+        pos -= step
+        f.seek(pos)
+        buffer = f.read(step) + buffer
+        lines = buffer.rstrip().split(b"\n")
+        if len(lines) > count:  # the first line may be cut off, it is only needed if pos == lo
+            return pos + len(b"\n".join(lines[:-count])) + 1
+    return lo
+
+
+def read_window_lines(path, window):
+    """
+    Read the header and the lines of the sessions in a time window, without reading the rest of the file
+    :return: (header line, data lines), both as strings with line breaks
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        lo = f.tell()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+        start = _find_line(f, lo, size, window.since, after=False) if window.since is not None else lo
+        end = _find_line(f, start, size, window.until, after=True) if window.until is not None else size
+        if window.last is not None:
+            start = max(start, _find_last_lines(f, start, end, window.last)) if window.last > 0 else end
+
+        f.seek(start)
+        data = f.read(end - start)
+    return header.decode(BILLINGS_ENCODING), data.decode(BILLINGS_ENCODING)
+
+
+def is_well_formed(tail):
+    """
+    Check whether the file ends with exactly one line break after the last line, in which case it can be patched in place.
+    """
+    return tail.line is not None and tail.size - tail.end == len(os.linesep)
+
+
+def rewrite_atomic(path, lines):
+    """
+    Write the complete file to a temporary file and move it over the billings file, so an interrupted write
+    never leaves a truncated file behind.
+    :param lines: New contents of the csv file, by line (without line breaks)
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+        for l in lines:
+            f.write(l + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    replace_file(temp_path, path)
+
+
+def replace_file(temp_path, path):
+    """
+    Move a completely written temporary file over path in one step
+    """
+    os.replace(temp_path, path)
+
+
+def replace_hidden_file(temp_path, path):
+    """
+    Like replace_file for a file marked with hide_file: hidden files cannot be replaced on Windows, so the attribute is
+    cleared first (the file stays in place, an interrupted replace leaves the old file) and set again afterwards
+    """
+    if os.path.exists(path):
+        _set_hidden(path, False)
+    os.replace(temp_path, path)
+    hide_file(path)
+
+
+def _read_lines_stripped(path):
+    with open(path, 'r') as f:
+        lines = [l.rstrip("\r\n") for l in f.readlines()]
+    while lines and lines[-1].strip() == "":
+        lines.pop()
+    return lines
+
+
+def _last_line_offset(path, line):
+    return os.path.getsize(path) - len((line + os.linesep).encode(BILLINGS_ENCODING))
+
+
+def append_line(path, tail, line):
+    """
+    Add a line to the end of the billings file.
+    :return: Byte offset at which the new line starts
+    """
+    if not is_well_formed(tail):
+        lines = _read_lines_stripped(path)
+        rewrite_atomic(path, lines + [line])
+        return _last_line_offset(path, line)
+
+    with open(path, 'r+b') as f:
+        f.seek(tail.size)
+        f.write((line + os.linesep).encode(BILLINGS_ENCODING))
+        sync_file(f, path)
+    return tail.size
+
+
+def replace_last_line(path, tail, line):
+    """
+    Overwrite the last line of the billings file in place.
+    :return: Byte offset at which the new line starts
+    """
+    if not is_well_formed(tail):
+        lines = _read_lines_stripped(path)
+        rewrite_atomic(path, lines[:-1] + [line])
+        return _last_line_offset(path, line)
+
+    with open(path, 'r+b') as f:
+        f.seek(tail.offset)
+        f.write((line + os.linesep).encode(BILLINGS_ENCODING))
+        f.truncate()
+        sync_file(f, path)
+    return tail.offset
+
+
+def truncate_at(path, offset):
+    """
+    Cut the billings file off at the given byte offset (used to take back an appended line).
+    """
+    with open(path, 'r+b') as f:
+        f.truncate(offset)
+
+
+def get_storage(client):
+    if client.storage == "sqlite":
+        return SqliteStorage(client)
+    return CsvStorage(client)
+
+
+class CsvStorage:
+    """
+    Sessions in the client's .csv billings file. The position of a session is the byte offset of its line.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.path = client.billings_filepath
+        self.snapshot_path = client.billings_backup_filepath
+        self._tail = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def create(self):
+        rewrite_atomic(self.path, [header_string])
+
+    def read_last(self):
+        """
+        :return: (position, csv_entry) of the last session, (0, None) if there are no sessions
+        """
+        self._tail = read_tail(self.path)
+        if self._tail.offset == 0:
+            return 0, None
+        return self._tail.offset, parse_csv_line(self._tail.line)
+
+    def _current_tail(self):
+        if self._tail is None:
+            self.read_last()
+        tail, self._tail = self._tail, None
+        return tail
+
+    def append(self, entry):
+        """
+        :return: Position of the new session
+        """
+        return append_line(self.path, self._current_tail(), entry.csv_format())
+
+    def replace_last(self, entry):
+        return replace_last_line(self.path, self._current_tail(), entry.csv_format())
+
+    def remove_last(self):
+        truncate_at(self.path, self._current_tail().offset)
+
+    def snapshot(self):
+        shutil.copyfile(self.path, self.snapshot_path)
+
+    def read_frame(self, columns=None, window=None):
+        """
+        Read the sessions into a DataFrame (with the columns of header_string)
+        :param columns: Only read these columns
+        :param window: Only read the sessions in this TimeWindow
+        """
+        import pandas as pd
+        if window is not None:
+            import io
+            header, data = read_window_lines(self.path, window)
+            return pd.read_csv(io.StringIO(header + data), sep=csv_delim, usecols=columns)
+        with open(self.path, 'r') as f:
+            return pd.read_csv(f, sep=csv_delim, usecols=columns)
+
+
+class SqliteStorage:
+    """
+    Sessions in an SQLite database per client, with indexes on the starting time, labels and projects.
+    The position of a session is its row id. Sessions migrated from the history folder keep the path of their
+    file (relative to the history folder) in the 'source' column, active sessions have an empty source.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL DEFAULT '',
+            start_date TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            projects TEXT NOT NULL,
+            description TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            minutes TEXT NOT NULL,
+            start_key INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_start ON sessions (source, start_key);
+        CREATE TABLE IF NOT EXISTS session_labels (session_id INTEGER NOT NULL, label TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS session_labels_label ON session_labels (label, session_id);
+        CREATE INDEX IF NOT EXISTS session_labels_session ON session_labels (session_id);
+        CREATE TABLE IF NOT EXISTS session_projects (session_id INTEGER NOT NULL, project TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS session_projects_project ON session_projects (project, session_id);
+        CREATE INDEX IF NOT EXISTS session_projects_session ON session_projects (session_id);
+    """
+    COLUMNS = {"Starting time": "start_date", "Labels": "labels", "Projects": "projects",
+               "Description": "description", "Ending time": "end_date", "Minutes": "minutes"}
+
+    def __init__(self, client):
+        self.client = client
+        self.path = client.sqlite_filepath
+        self.snapshot_path = client.sqlite_backup_filepath
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.executescript(self.SCHEMA)
+        return connection
+
+    def create(self):
+        self.connect().close()
+
+    def read_last(self):
+        with self.connect() as connection:
+            row = connection.execute("SELECT id, start_date, labels, projects, description, end_date, minutes FROM sessions "
+                                     "WHERE source = '' ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            return 0, None
+        return row[0], csv_entry(*row[1:])
+
+    @staticmethod
+    def _insert(connection, entry, source=""):
+        cursor = connection.execute("INSERT INTO sessions (source, start_date, labels, projects, description, end_date, minutes, start_key) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (source, entry.start_date, entry.labels, entry.projects, entry.description,
+                                     entry.end_date, str(entry.minutes), get_start_key(entry.start_date)))
+        SqliteStorage._index_sets(connection, cursor.lastrowid, entry)
+        return cursor.lastrowid
+
+    @staticmethod
+    def _index_sets(connection, session_id, entry):
+        connection.execute("DELETE FROM session_labels WHERE session_id = ?", (session_id,))
+        connection.execute("DELETE FROM session_projects WHERE session_id = ?", (session_id,))
+        connection.executemany("INSERT INTO session_labels VALUES (?, ?)", [(session_id, l) for l in set(entry.labels.split(set_delim))])
+        connection.executemany("INSERT INTO session_projects VALUES (?, ?)", [(session_id, p) for p in set(entry.projects.split(set_delim))])
+
+    def append(self, entry):
+        with self.connect() as connection:  # commits the transaction, or rolls it back on errors
+            return self._insert(connection, entry)
+
+    def replace_last(self, entry):
+        with self.connect() as connection:
+            session_id = connection.execute("SELECT MAX(id) FROM sessions WHERE source = ''").fetchone()[0]
+            connection.execute("UPDATE sessions SET start_date = ?, labels = ?, projects = ?, description = ?, end_date = ?, "
+                               "minutes = ?, start_key = ? WHERE id = ?",
+                               (entry.start_date, entry.labels, entry.projects, entry.description, entry.end_date,
+                                str(entry.minutes), get_start_key(entry.start_date), session_id))
+            self._index_sets(connection, session_id, entry)
+        return session_id
+
+    def remove_last(self):
+        with self.connect() as connection:
+            session_id = connection.execute("SELECT MAX(id) FROM sessions WHERE source = ''").fetchone()[0]
+            for table in ["session_labels", "session_projects"]:
+                connection.execute("DELETE FROM {} WHERE session_id = ?".format(table), (session_id,))
+            connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def update_minutes(self, minutes_by_id):
+        with self.connect() as connection:
+            connection.executemany("UPDATE sessions SET minutes = ? WHERE id = ?", [(str(m), i) for i, m in minutes_by_id.items()])
+
+    def snapshot(self):
+        with self.connect() as connection, sqlite3.connect(self.snapshot_path) as snapshot:
+            connection.backup(snapshot)
+
+    def read_records(self):
+        """
+        :return: List of (row id, csv_entry) of all active sessions
+        """
+        with self.connect() as connection:
+            rows = connection.execute("SELECT id, start_date, labels, projects, description, end_date, minutes FROM sessions "
+                                      "WHERE source = '' ORDER BY id").fetchall()
+        return [(row[0], csv_entry(*row[1:])) for row in rows]
+
+    def read_frame(self, columns=None, window=None):
+        """
+        Read the active sessions into a DataFrame (with the columns of header_string), like CsvStorage.read_frame
+        """
+        import pandas as pd
+        columns = columns if columns is not None else list(self.COLUMNS.keys())
+        select = ", ".join('{} AS "{}"'.format(self.COLUMNS[c], c) for c in columns)
+        where, parameters = "source = ''", []
+        if window is not None and window.since is not None:
+            where, parameters = where + " AND start_key >= ?", parameters + [window.since]
+        if window is not None and window.until is not None:
+            where, parameters = where + " AND start_key <= ?", parameters + [window.until]
+        query = "SELECT id, " + select + " FROM sessions WHERE " + where + " ORDER BY id"
+        if window is not None and window.last is not None:  # the last sessions, back in chronological order
+            query = "SELECT * FROM (SELECT id, " + select + " FROM sessions WHERE " + where + " ORDER BY id DESC LIMIT ?) ORDER BY id"
+            parameters.append(window.last)
+        with self.connect() as connection:
+            df = pd.read_sql_query(query, connection, params=parameters).drop(columns="id")
+        df = df.replace({"": None})  # like empty fields in read_csv
+        if "Minutes" in df.columns:
+            df["Minutes"] = pd.to_numeric(df["Minutes"], errors='coerce')
+        return df
+
+    def read_history_frame(self, columns):
+        """
+        Read the sessions migrated from the history folder into a DataFrame, like read_frame
+        """
+        import pandas as pd
+        select = ", ".join('{} AS "{}"'.format(self.COLUMNS[c], c) for c in columns)
+        with self.connect() as connection:
+            df = pd.read_sql_query("SELECT " + select + " FROM sessions WHERE source != '' ORDER BY id", connection)
+        df = df.replace({"": None})
+        if "Minutes" in df.columns:
+            df["Minutes"] = pd.to_numeric(df["Minutes"], errors='coerce')
+        return df
+
+    def read_history_columns(self):
+        """
+        :return: List of (starting time, minutes) arrays, one per migrated history file (see billingshistory.load_history)
+        """
+        import numpy as np
+        with self.connect() as connection:
+            rows = connection.execute("SELECT source, start_date, minutes FROM sessions WHERE source != '' ORDER BY id").fetchall()
+        history = {}
+        for source, start_date, minutes in rows:
+            history.setdefault(source, ([], []))
+            history[source][0].append(start_date)
+            history[source][1].append(float(minutes) if minutes != "" else np.nan)
+        return [(np.array(starting_time, dtype=str), np.array(minutes, dtype=float)) for starting_time, minutes in history.values()]
+
+
+def _read_csv_entries(path):
+    with open(path, 'r') as f:
+        lines = [l.rstrip("\r\n") for l in f.readlines()[1:]]
+    return [parse_csv_line(l) for l in lines if l.strip() != ""]
+
+
+def migrate_to_sqlite(client, history_files):
+    """
+    Copy the active billings file and the given history files of a client into a new SQLite database
+    """
+    storage = SqliteStorage(client)
+    if storage.exists():
+        raise RuntimeError("Please delete or move the existing database at: "+storage.path+" before migrating")
+
+    with storage.connect() as connection:
+        for path in history_files:
+            source = os.path.relpath(path, client.history_folder)
+            for entry in _read_csv_entries(path):
+                SqliteStorage._insert(connection, entry, source)
+        entries = _read_csv_entries(client.billings_filepath)
+        for entry in entries:
+            SqliteStorage._insert(connection, entry)
+
+    storage.snapshot()
+    if os.path.exists(client.billings_journal_filepath):  # positions in the journal refer to the .csv file
+        os.remove(client.billings_journal_filepath)
+
+    print("Migrated {} active sessions and {} history files to {}".format(len(entries), len(history_files), storage.path))
+    print("Add storage=\"sqlite\" to the client in billingsconstants.py to start using it.")
@@ -0,0 +1,105 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+"""
+Per-phase timings (--timings) and profiling (--profile) for writebillings and drawbillings.
+
+Each named phase records its wall time and the net change in the number of memory blocks the interpreter holds
+(sys.getallocatedblocks: blocks allocated minus blocks freed during the phase, not the number of allocations),
+optionally per client. The timings are printed as a table at the end of the run, or appended to a file as JSON lines
+(--timings-file). While timings are off, entering a phase costs next to nothing.
+"""
+
+TIMINGS_TABLE = "-"  # output of PhaseTimer for a printed table
+
+
+class PhaseTimer:
+    def __init__(self, output=None):
+        """
+        :param output: File to append JSON lines to, TIMINGS_TABLE to print a table, None to record nothing
+        """
+        self.output = output
+        self.records = []
+
+    @contextmanager
+    def phase(self, name, client=None):
+        """
+        Record the wall time and the net change in allocated memory blocks of the code in a with-block
+        :param client: Client the phase works on, if any
+        """
+        if self.output is None:
+            yield
+            return
+
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append({"phase": name, "client": client.name if client is not None else None,
+                                 "wall_ms": (time.perf_counter() - start) * 1000,
+                                 "net_blocks": sys.getallocatedblocks() - blocks})
+
+    def report(self, script):
+        """
+        Print the table or append the JSON lines of all recorded phases
+        :param script: Name of the script, added to every JSON line
+        """
+        if self.output is None or not self.records:
+            return
+
+        if self.output != TIMINGS_TABLE:
+            with open(self.output, 'a') as f:
+                for record in self.records:
+                    f.write(json.dumps(dict(record, script=script)) + "\n")
+            return
+
+        print("{:<28}{:<20}{:>12}{:>18}".format("phase", "client", "wall [ms]", "net blocks"))
+        for record in self.records:
+            print("{:<28}{:<20}{:>12.1f}{:>18}".format(record["phase"], record["client"] or "-", record["wall_ms"], record["net_blocks"]))
+        print("{:<48}{:>12.1f}".format("total", sum(r["wall_ms"] for r in self.records)))
+
+
+NO_TIMER = PhaseTimer()  # default for functions that take a timer
+
+
+def add_instrumentation_arguments(parser):
+    parser.add_argument('--timings', dest='timings', action='store_true',
+                        help="Record the wall time and the net change in allocated memory blocks of each phase (per client) "
+                             "and print them as a table at the end.")
+    parser.add_argument('--timings-file', dest='timings_file', metavar='FILE', type=str, default=None,
+                        help="Like --timings, but append the timings to FILE as JSON lines instead of printing a table.")
+    parser.add_argument('--profile', dest='profile', metavar='FILE', type=str, default=None,
+                        help="Profile the whole run with cProfile and write the pstats dump to FILE "
+                             "(view it with 'python -m pstats FILE').")
+
+
+def create_timer(arguments):
+    """
+    :param arguments: Parsed arguments of a parser set up with add_instrumentation_arguments
+    """
+    if arguments.timings_file is not None:
+        return PhaseTimer(arguments.timings_file)
+    return PhaseTimer(TIMINGS_TABLE if arguments.timings else None)
+
+
+def start_profile(path):
+    """
+    :return: Running profiler, None if path is None
+    """
+    if path is None:
+        return None
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profile(profiler, path):
+    if profiler is None:
+        return
+    profiler.disable()
+    profiler.dump_stats(path)
+    print("Profile saved to "+path)
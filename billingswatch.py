@@ -0,0 +1,275 @@
+import asyncio
+import ctypes
+import ctypes.util
+import sys
+from datetime import datetime
+
+from billingsconstants import *
+from billingsstorage import BILLINGS_ENCODING, get_storage, parse_session_line
+from billingspause import get_paused_time, is_paused, read_pause_ledger
+
+"""
+Live totals of the active billings files for drawbillings --watch.
+
+The financial folders are watched with inotify (through ctypes, Linux only) or, where that is not available, by checking
+the billings files every few seconds. Sessions are only added or changed at the end of a billings file, so after an
+event only the bytes from the start of the last session on are read again; everything before it is kept as running
+totals. If the file was replaced (e.g. by a rollover or 'check --fix') or the bytes before the last session changed,
+the file is read again from the start. Lines without the fields of a session (edited by hand, or still being
+written) are skipped and counted, so they can be shown.
+
+Between events nothing runs, except for one update per minute while a session is open, to show its running time.
+"""
+
+WATCH_POLL_SECONDS = 2.  # interval of the polling fallback
+WATCH_DEBOUNCE_SECONDS = 0.05  # a command writes several files, wait for it to finish before reading
+GUARD_BYTES = 64  # bytes before the last session that are compared to notice changes further up in the file
+
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x2, 0x8, 0x80, 0x100, 0x200
+IN_NONBLOCK, IN_CLOEXEC = os.O_NONBLOCK, 0o2000000
+
+
+def _read_minutes(entry):
+    try:
+        return float(entry.minutes)
+    except ValueError:  # open session
+        return 0.
+
+
+class ActiveTotals:
+    """
+    Minutes in total and per day of a client's active billings file, kept up to date by parsing only its end
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.path = get_storage(client).path
+        self.pausefile_path = os.path.join(client.financial_folder, client.pausefile_name)
+        self.stamp = None
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.offset = 0  # byte offset of the last session (0 while the header was not read)
+        self.guard = b""  # the GUARD_BYTES before offset
+        self.settled_minutes = 0.  # minutes of all sessions before the last one
+        self.settled_days = {}
+        self.settled_unreadable = 0  # lines before the last one that could not be read
+        self.last_entry = None  # None if the last line cannot be read
+        self.last_line = None
+
+    def _is_unchanged_before_last(self, f, size):
+        if size < self.offset:
+            return False
+        f.seek(self.offset - len(self.guard))
+        return f.read(len(self.guard)) == self.guard
+
+    def refresh(self):
+        """
+        Parse what was written to the billings file since the last call
+        :return: True if the file changed
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            changed = self.stamp is not None
+            self.stamp = None
+            self._reset(None)
+            return changed
+
+        stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if stamp == self.stamp:
+            return False
+        self.stamp = stamp
+
+        with open(self.path, 'rb') as f:
+            if stat.st_ino != self.inode or not self._is_unchanged_before_last(f, stat.st_size):
+                self._reset(stat.st_ino)
+            if not self._read_from_offset(f) and self.offset > 0:  # the last session was taken back ('undo')
+                self._reset(stat.st_ino)
+                self._read_from_offset(f)
+        return True
+
+    def _read_from_offset(self, f):
+        """
+        :return: False if there is no session from offset on
+        """
+        f.seek(self.offset)
+        data = f.read()
+        position = self.offset
+        last = None  # (offset, line) of the last non-empty line read
+        for raw_line in data.split(b"\n"):
+            line_offset, position = position, position + len(raw_line) + 1
+            if line_offset == 0:  # header
+                continue
+            line = raw_line.decode(BILLINGS_ENCODING).rstrip("\r")
+            if not line.strip():
+                continue
+            if last is not None:
+                self._settle(parse_session_line(last[1]))
+            last = (line_offset, line)
+
+        if last is None:
+            self.last_entry, self.last_line = None, None
+            return False
+        self.last_entry, self.last_line = parse_session_line(last[1]), last[1]
+        self.offset = last[0]
+        f.seek(max(0, self.offset - GUARD_BYTES))
+        self.guard = f.read(self.offset - max(0, self.offset - GUARD_BYTES))
+        return True
+
+    def _settle(self, entry):
+        if entry is None:
+            self.settled_unreadable += 1
+            return
+        minutes = _read_minutes(entry)
+        self.settled_minutes += minutes
+        day = entry.start_date[:10]
+        self.settled_days[day] = self.settled_days.get(day, 0) + minutes
+
+    def unreadable_lines(self):
+        """
+        :return: Number of lines that were skipped because they do not have the fields of a session
+        """
+        return self.settled_unreadable + (1 if self.last_line is not None and self.last_entry is None else 0)
+
+    def total_minutes(self):
+        return self.settled_minutes + (_read_minutes(self.last_entry) if self.last_entry is not None else 0)
+
+    def get_day_minutes(self, day):
+        """
+        :param day: datetime or date
+        :return: Minutes of the finished sessions started on that day
+        """
+        day_string = day.strftime(time_format_daily)
+        minutes = self.settled_days.get(day_string, 0)
+        if self.last_entry is not None and self.last_entry.start_date[:10] == day_string:
+            minutes += _read_minutes(self.last_entry)
+        return minutes
+
+    def get_open_session(self, now):
+        """
+        :return: (running minutes without pauses, paused) of the open session, None if no session is open
+        """
+        if self.last_entry is None or self.last_entry.end_date.strip():
+            return None
+        try:
+            start = datetime.strptime(self.last_entry.start_date, time_format)
+        except ValueError:
+            return None
+        ledger = read_pause_ledger(self.pausefile_path)
+        paused = get_paused_time(ledger)
+        if is_paused(ledger):
+            paused += now - ledger[-1][0]
+        return max(0, int((now - start - paused).total_seconds() // 60)), is_paused(ledger)
+
+
+class InotifyWatcher:
+    """
+    inotify instance watching folders for changed files, through the C library
+    """
+
+    def __init__(self, folders):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for folder in folders:
+            if libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE) < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, "inotify_add_watch failed for "+folder)
+
+    def drain(self):
+        """
+        Read all pending events (which files changed does not matter, every client is refreshed)
+        """
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(folders):
+    """
+    :return: InotifyWatcher, None if inotify is not available (then the files are polled)
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return InotifyWatcher(folders)
+    except (OSError, AttributeError):
+        return None
+
+
+class LiveDisplay:
+    """
+    Prints a block of lines, overwriting the previously printed block on terminals
+    """
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.lines = None
+
+    def show(self, lines):
+        if lines == self.lines:
+            return
+        if self.lines is not None:
+            if self.stream.isatty():
+                self.stream.write("\x1b[{}F\x1b[J".format(len(self.lines)))  # back to the first line, clear below
+            else:
+                self.stream.write("\n")
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+        self.lines = lines
+
+
+def _seconds_to_next_minute(now):
+    return 60 - now.second - now.microsecond / 1e6 + 0.01
+
+
+async def watch(clients, render, poll_interval=WATCH_POLL_SECONDS, display=None):
+    """
+    Show the live totals of the clients until cancelled
+    :param clients: Clients to watch (.csv storage)
+    :param render: Function (list of ActiveTotals, now) -> list of lines to show
+    :param poll_interval: Seconds between checks of the files if inotify is not available
+    """
+    totals = [ActiveTotals(client) for client in clients]
+    display = display or LiveDisplay()
+    changed = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    watcher = open_watcher(sorted({os.path.dirname(t.path) for t in totals}))
+    if watcher is not None:
+        def on_event():
+            watcher.drain()
+            changed.set()
+        loop.add_reader(watcher.fd, on_event)
+    else:
+        print("inotify is not available, checking the billings files every {} seconds".format(poll_interval))
+
+    try:
+        while True:
+            for t in totals:
+                t.refresh()
+            now = datetime.now()
+            display.show(render(totals, now))
+
+            timeout = poll_interval if watcher is None else None
+            if any(t.get_open_session(now) is not None for t in totals):
+                timeout = min(timeout or 60, _seconds_to_next_minute(now))
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+                await asyncio.sleep(WATCH_DEBOUNCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            changed.clear()
+    finally:
+        if watcher is not None:
+            loop.remove_reader(watcher.fd)
+            watcher.close()
@@ -1,57 +1,127 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
+import asyncio
+import hashlib
+import json
 import numpy as np
-import sys
 from datetime import datetime, timedelta
 
 from billingsconstants import *
+from billingshistory import *
+from billingsrollup import load_daily_rollup
+from billingsindex import bits_to_mask, load_session_index, select_sessions
+from billingssessions import EPOCH_ORDINAL, MINUTES_PER_DAY, MISSING_MINUTES, MISSING_TIME, format_times, get_day_ordinals
+from billingsstorage import get_storage, get_window
+from billingswatch import WATCH_POLL_SECONDS, watch
+from billingsreport import REPORT_PERIODS, build_report
+from billingsexport import export_sessions
+from billingstimings import add_instrumentation_arguments, create_timer, start_profile, stop_profile
+from concurrent.futures import ProcessPoolExecutor
+
+parser = argparse.ArgumentParser(description="Summarize and visualize the billings of one client (or of all clients if no name is given).")
+parser.add_argument('client_name', metavar="client_name", type=str, nargs='?', default=None,
+                    help="Client to draw the billings for. Draws for each client if omitted.")
+parser.add_argument('--rebuild-cache', dest='rebuild_cache', action='store_true',
+                    help="Re-read every file in the history folders instead of using the cached history (see HISTORY_CACHE_NAME).")
+parser.add_argument('-j', dest='jobs', metavar='N', type=int, default=1,
+                    help="Read and parse the billings files of all clients using N processes.")
+parser.add_argument('--output-dir', dest='output_dir', metavar='DIR', type=str, default=None,
+                    help="Save the charts of every client to files in DIR instead of showing them (no display needed). "
+                         "Charts whose data did not change since the last export are skipped.")
+parser.add_argument('--label', dest='query_labels', metavar='LABEL', type=str, action='append', default=[],
+                    help="Only report on the sessions with this label (can be given several times, sessions need all of them). "
+                         "Prints the matching hours and billing instead of the charts.")
+parser.add_argument('--project', dest='query_projects', metavar='PROJECT', type=str, action='append', default=[],
+                    help="Only report on the sessions with this project (can be given several times, like --label).")
+parser.add_argument('--since', dest='since', metavar='DD.MM.YYYY', type=str, default=None,
+                    help="Only read the sessions started on or after this day. "
+                         "Only this part of the billings file is read, the daily volumes and expected payouts are not shown.")
+parser.add_argument('--until', dest='until', metavar='DD.MM.YYYY', type=str, default=None,
+                    help="Only read the sessions started on or before this day (like --since).")
+parser.add_argument('--last', dest='last', metavar='N', type=int, default=None,
+                    help="Only read the last N sessions (of the days given with --since/--until, like --since).")
+parser.add_argument('--format', dest='file_format', type=str, choices=["png", "svg"], default="png",
+                    help="File format of the charts saved with --output-dir.")
+parser.add_argument('--watch', dest='watch', action='store_true',
+                    help="Keep running and update the totals, today's and yesterday's minutes, the expected payout and the "
+                         "running time of an open session whenever a billings file changes (only the active billings files are read).")
+parser.add_argument('--poll', dest='poll_interval', metavar='SECONDS', type=float, default=WATCH_POLL_SECONDS,
+                    help="Used with --watch where inotify is not available: seconds between checks of the billings files.")
+parser.add_argument('--report', dest='report', type=str, choices=REPORT_PERIODS, default=None,
+                    help="Print the sessions, hours, billing (also in €) and hours per label and project of every week, month "
+                         "or year, over the active billings file and the whole history (only --since and --until apply).")
+parser.add_argument('--csv', dest='csv', metavar='FILE', nargs='?', const='-', default=None,
+                    help="Used with --report: write the report as CSV to FILE (or to the console if no FILE is given) instead of a table.")
+parser.add_argument('--export-dir', dest='export_dir', metavar='DIR', type=str, default=None,
+                    help="Write all sessions (with the history) to a Parquet dataset in DIR, partitioned by client and month, "
+                         "instead of drawing. Only the partitions that changed since the last export are written (needs pyarrow).")
+add_instrumentation_arguments(parser)
+
+
+def draw_pie(ax, client, pie_values, pie_labels, verify_minutes):
+    _, autotexts = ax.pie(pie_values, labels=pie_labels, shadow=True, explode=np.ones(len(pie_values))*0.04)
 
-drawclients = []
-
-if len(sys.argv) > 1 and sys.argv[1] != "":
-    client = get_client_by_name(sys.argv[1])
-else:
-    client = None
+    for i, a in enumerate(autotexts):
+        a.set_text(pie_labels[i]+": {} ({}%)".format(int(pie_values[i]), int(1000*(pie_values[i]/verify_minutes))/10))
 
-if client is None:
-    if client_list is None or len(client_list)==0:
-        raise RuntimeError("Got None clients_list or no clients have been added yet!")
-    print("Got no client for drawbillings, drawing for each")
-    drawclients = client_list
-else:
-    drawclients = [client]
+    ax.set_title(plot_time_distribution_in_minutes[client.language])
+    ax.axis('equal')
 
 
-def get_minutes_map(map_me):
+class ChartExporter:
     """
-    Turn a column of delimited fields into a zero-initialized map
-    :param map_me:
-    :return:
+    Renders charts straight to files with the non-interactive Agg backend, reusing a single figure for all charts.
+    A manifest in the output folder keeps a hash of the data of every chart, charts whose data did not change since
+    the last export are not rendered again.
     """
-    split_m = []
-    for m in map_me:
-        M = m.split(set_delim)
-        split_m += [m_s for m_s in M]
-
-    map_minutes = {}
-    for m in split_m:
-        map_minutes[m] = 0
-
-    return map_minutes
 
+    def __init__(self, output_dir, file_format):
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.manifest_path = os.path.join(output_dir, CHART_MANIFEST_NAME)
+        self.manifest = {}
+        os.makedirs(output_dir, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        self.figure = plt.figure()
+
+    def export_pie(self, chart_name, client, pie_values, pie_labels, verify_minutes):
+        file_name = chart_name + "." + self.file_format
+        path = os.path.join(self.output_dir, file_name)
+        data = [client.language, [float(v) for v in pie_values], [str(l) for l in pie_labels], float(verify_minutes)]
+        key = hashlib.sha1(json.dumps(data).encode("utf-8")).hexdigest()
+        if self.manifest.get(file_name) == key and os.path.exists(path):
+            print("Chart unchanged: "+path)
+            return
+
+        self.figure.clf()
+        draw_pie(self.figure.add_subplot(), client, pie_values, pie_labels, verify_minutes)
+        self.figure.savefig(path, format=self.file_format)
+        self.manifest[file_name] = key
+        print("Saved chart: "+path)
+
+    def close(self):
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+
+
+def show_pie(client, pie_values, pie_labels, verify_minutes, exporter=None, chart_name=None):
+    """
+    Show a pie chart (or export it to a file if an exporter is given) and print the billing per area
+    """
+    if exporter is not None:
+        exporter.export_pie(chart_name, client, pie_values, pie_labels, verify_minutes)
+    else:
+        import matplotlib.pyplot as plt  # only imported once something is drawn
 
-def show_pie(client, pie_values, pie_labels):
-
-    _, autotexts = plt.pie(pie_values, labels=pie_labels, shadow=True, explode=np.ones(len(pie_values))*0.04)
-
-    for i, a in enumerate(autotexts):
-        a.set_text(pie_labels[i]+": {} ({}%)".format(int(pie_values[i]), int(1000*(pie_values[i]/VERIFY_MINUTES))/10))
-
-    plt.title(plot_time_distribution_in_minutes[client.language])
-    plt.axis('equal')
-    plt.show()
+        draw_pie(plt.gca(), client, pie_values, pie_labels, verify_minutes)
+        plt.show()
 
-    plt.show()
+        plt.show()
     hours = [pie_values[i]/60 for i in range(len(pie_labels))]
     bills = [hours[i] * client.hourly_wage for i in range(len(hours))]
     
@@ -63,128 +133,253 @@ def print_conversion_subscript(client, amount):
     print("      (= €"+to_truncated_string(amount*CONVERSIONS_TO_EUR[client.currency_symbol])+")")
 
 
-def add_mins_for_column(map_add_me, column, column_name):
+def get_minutes_for_column(sessions, column_name, verify_minutes):
     """
-    Add up the minutes for a column
-    :param map_add_me:
-    :param column:
-    :return:
+    Add up the minutes for each label (or project) on the interned sets of a SessionTable.
+    The minutes of a session are split evenly between all of its labels.
+    :param sessions: SessionTable of the billings data
+    :param column_name: "labels" or "projects"
+    :param verify_minutes: Expected total of all minutes
+    :return: Map from label to minutes
     """
-    for l in column:  # split up the entries by label to add them
-        l_view = df.where(df[column_name] == l, None)
-        l_split = l.split(set_delim)
-
-        for sublabel in l_split:
-            min_sum = l_view["Minutes"].sum(skipna=True)
-            map_add_me[sublabel] += (min_sum/len(l_split))
+    # open sessions have no minutes yet, their labels still show up with 0 minutes
+    map_minutes = sessions.minutes_per_name(column_name)
 
     RESULT_SUM = 0
-    for v in map_add_me.values():
+    for v in map_minutes.values():
         RESULT_SUM += v
 
-    assert abs(VERIFY_MINUTES - RESULT_SUM )<0.1, "Expected {} minutes, got {} minutes".format(VERIFY_MINUTES, RESULT_SUM)
+    assert abs(verify_minutes - RESULT_SUM )<0.1, "Expected {} minutes, got {} minutes".format(verify_minutes, RESULT_SUM)
+
+    return map_minutes
+
+
+def get_epoch_minutes(day_string):
+    """
+    :param day_string: Day in time_format_daily
+    :return: Start of the day in epoch minutes (see billingssessions)
+    """
+    return (datetime.strptime(day_string, time_format_daily).toordinal() - EPOCH_ORDINAL) * MINUTES_PER_DAY
 
 
-def get_daily_work_volume(client, starting_time_columns_client):
+def query_billings(client, sessions, args):
+    """
+    Print the number of sessions, hours and billing of the sessions matching the filters of the command line.
+    Label and project filters are looked up in the bitmap index of the client (see billingsindex), which covers all
+    active sessions, so the time window is applied to the complete SessionTable.
+    :return: Billing of the matching sessions in €
+    """
+    index = load_session_index(client, sessions, rebuild=args.rebuild_cache)
+    selected = bits_to_mask(select_sessions(index, args.query_labels, args.query_projects), len(sessions))
+
+    start = sessions.sessions["start"]
+    in_window = np.ones(len(sessions), dtype=bool)
+    if args.since:
+        in_window &= start >= get_epoch_minutes(args.since)
+    if args.until:
+        in_window &= (start != MISSING_TIME) & (start < get_epoch_minutes(args.until) + MINUTES_PER_DAY)
+    if args.last is not None:
+        in_window[np.flatnonzero(in_window)[:-args.last or len(in_window)]] = False
+    selected &= in_window
+
+    minutes = sessions.sessions["minutes"][selected]
+    query_minutes = int(minutes[minutes != MISSING_MINUTES].sum())
+    income = query_minutes * (client.hourly_wage/60.)
+    filters = ["label "+l for l in args.query_labels] + ["project "+p for p in args.query_projects] + \
+              (["since "+args.since] if args.since else []) + (["until "+args.until] if args.until else []) + \
+              (["last "+str(args.last)] if args.last is not None else [])
+    print("Sessions with "+", ".join(filters)+": "+str(int(selected.sum())))
+    print("Time worked: " + str(query_minutes//60) + " hours and " + str(query_minutes%60) + " minutes.")
+    print("Billing: "+client.currency_symbol+to_truncated_string(income))
+    if client.currency_symbol != '€':
+        print_conversion_subscript(client, income)
+    return income*CONVERSIONS_TO_EUR[client.currency_symbol]
+
+
+def get_payout_multiplicator(client, client_euro, verbose=True):
+    """
+    :param client_euro: Billing of the client so far, in €
+    :return: Factor from the billing so far to the expected billing over the whole billing period (31 days)
+    """
+    today_int = datetime.now().day
+    days_past_due = today_int - client.due_date if today_int > client.due_date else ((31 + today_int) - client.due_date)
+    if days_past_due == 0:
+        if(client_euro > 300):
+            if verbose:
+                print("Got due date equal to today's day of the month, assuming the invoice contains a full month's work (is not new)")
+            days_past_due = 31
+        else:
+            if verbose:
+                print("Got due date equal to today's day of the month, assuming the invoice is due in 31 days")
+            days_past_due = 1
+    # print("Days past due: "+str(days_past_due))
+    return 31/days_past_due
+
+
+def render_watch(totals, now):
+    """
+    :param totals: ActiveTotals of the watched clients (see billingswatch)
+    :return: Lines to show in watch mode
+    """
+    lines = [now.strftime(time_format)]
+    total_euro = 0
+    total_monthly_payout = 0
+    for t in totals:
+        client = t.client
+        minutes = t.total_minutes()
+        income = minutes * (client.hourly_wage/60.)
+        client_euro = income*CONVERSIONS_TO_EUR[client.currency_symbol]
+        total_euro += client_euro
+        if client_euro != 0:
+            total_monthly_payout += get_payout_multiplicator(client, client_euro, verbose=False)*client_euro
+
+        lines.append("Client: {}, time worked: {} hours and {} minutes, billing: {}".format(
+            client.name, int(minutes//60), int(minutes%60), client.currency_symbol+to_truncated_string(income)))
+        lines.append("    Worked {} minutes today, {} minutes yesterday".format(
+            int(t.get_day_minutes(now)), int(t.get_day_minutes(now - timedelta(hours=24)))))
+        open_session = t.get_open_session(now)
+        if open_session is not None:
+            lines.append("    Open session: {} minutes{}".format(open_session[0], " (paused)" if open_session[1] else ""))
+        if t.unreadable_lines():
+            lines.append("    Skipped {} line{} that cannot be read (see 'writebillings.ps1 check')".format(
+                t.unreadable_lines(), "" if t.unreadable_lines() == 1 else "s"))
+    lines.append("Total current billing: €"+to_truncated_string(total_euro))
+    lines.append("Expected end-of-billings payout (for these and no further clients, each over 31 days): €"+to_truncated_string(total_monthly_payout))
+    return lines
+
+
+def print_report(report, csv_path=None):
+    """
+    :param report: DataFrame of billingsreport.build_report
+    :param csv_path: File to write the report to as CSV, '-' for the console, None to print a table
+    """
+    if csv_path is None:
+        if len(report) == 0:
+            print("No finished sessions to report")
+        else:
+            print(report.to_string(index=False))
+    elif csv_path == '-':
+        print(report.to_csv(sep=csv_delim, index=False), end="")
+    else:
+        report.to_csv(csv_path, sep=csv_delim, index=False)
+        print("Report saved to "+csv_path)
+
+
+def get_daily_work_volume(client, starting_time_columns_client, billings_stamp, rebuild=False):
+    """
+    Print the minutes worked today and yesterday, using the daily rollup of the client (see billingsrollup)
+    :param starting_time_columns_client: (starting time, minutes) columns of the active file (as epoch minutes) and the history, only read if the rollup is out of date
+    :param billings_stamp: Stamp of the active file taken before it was read (SessionTable.stamp)
+    :return: Minutes worked on each day with sessions
+    """
     try:
-        this_month_records = len(starting_time_columns_client[0][0]) - 1
-        START, MINUTES = [], []
-        for starting_time, minutes in starting_time_columns_client:
-            START.extend(starting_time)
-            MINUTES.extend(minutes)
-        START, MINUTES = np.array(START), np.array(MINUTES)
-        daily_volumes = {}
-        start_day_strings = [start_time[:10] for start_time in START]  # read in the first ten characters of the date string (equal to the calendar day, month, and year)
-        for ind, start_day_string in enumerate(start_day_strings):
-            daily_volumes[start_day_string] = []
-            if ind == this_month_records:
-                print("INFO: Worked on {} days since: ".format(len(daily_volumes))+start_day_strings[0])  # we only want to know about this month
-        for ind, start_day_string in enumerate(start_day_strings):
-            daily_volumes[start_day_string].append(ind)  # get the indices of common start days
-
-        for start_day in daily_volumes.keys():
-            daily_volumes[start_day] = MINUTES[daily_volumes[start_day]].sum()
+        first_ordinal, daily_volumes = load_daily_rollup(client, starting_time_columns_client, billings_stamp, rebuild=rebuild)
+
+        this_month_start = starting_time_columns_client[0][0][0]
+        this_month_index = max(int(get_day_ordinals(this_month_start)) - first_ordinal, 0)
+        print("INFO: Worked on {} days since: ".format(int((daily_volumes[this_month_index:] > 0).sum()))+format_times([this_month_start])[0][:10])  # we only want to know about this month
 
         now = datetime.now()
         yesterday = now - timedelta(hours=24)
-        
-        try:
-            earning = (daily_volumes[now.strftime(time_format)[:10]]/60)*client.hourly_wage
-            print("Worked {} minutes today, earning {}".format(daily_volumes[now.strftime(time_format)[:10]], client.currency_symbol+to_truncated_string(earning)))
-            if client.currency_symbol != '€':
-                print_conversion_subscript(client, earning)
-        except KeyError as e:
-            pass
-           
-        try:
-            earning = (daily_volumes[yesterday.strftime(time_format)[:10]]/60)*client.hourly_wage
-            print("Worked {} minutes yesterday, earning {}".format(daily_volumes[yesterday.strftime(time_format)[:10]], client.currency_symbol+to_truncated_string(earning)))
-            if client.currency_symbol != '€':
-                print_conversion_subscript(client, earning)
-        except Exception as e:
-            print(e)
-        
-        return daily_volumes.values()
+
+        for day, day_name in [(now, "today"), (yesterday, "yesterday")]:
+            index = day.date().toordinal() - first_ordinal
+            if 0 <= index < len(daily_volumes) and daily_volumes[index] > 0:
+                earning = (daily_volumes[index]/60)*client.hourly_wage
+                print("Worked {} minutes {}, earning {}".format(daily_volumes[index], day_name, client.currency_symbol+to_truncated_string(earning)))
+                if client.currency_symbol != '€':
+                    print_conversion_subscript(client, earning)
+
+        return daily_volumes[daily_volumes > 0]
     except Exception as e:
         print("Failed to generate daily work volumes. (Expected if there is no client history)")
 
 
-exception = False
-total_euro = 0
-total_monthly_payout = 0
-conversion_used = []
+def main():
+    command_line_parse = parser.parse_args()
+    timer = create_timer(command_line_parse)
+    profiler = start_profile(command_line_parse.profile)
 
-starting_time_columns = {}  
+    drawclients = []
 
-smallsep =  "---------"
-bigsep = "---------------------"
+    if command_line_parse.client_name:
+        client = get_client_by_name(command_line_parse.client_name)
+    else:
+        client = None
 
+    if client is None:
+        if client_list is None or len(client_list)==0:
+            raise RuntimeError("Got None clients_list or no clients have been added yet!")
+        print("Got no client for drawbillings, drawing for each")
+        drawclients = list(client_list)
+    else:
+        drawclients = [client]
 
-for client in drawclients:
-    try:
-        print(bigsep)
-        print("Client: "+client.name)
-        starting_time_columns[client.name] = []
-        
-        with open(client.billings_filepath, 'r') as f:
+    if command_line_parse.watch:
+        watched = [c for c in drawclients if c.storage == "csv"]
+        for c in drawclients:
+            if c not in watched:
+                print("Not watching "+c.name+" (--watch reads .csv billings files only)")
+        try:
+            asyncio.run(watch(watched, render_watch, command_line_parse.poll_interval))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if command_line_parse.report:
+        since = get_epoch_minutes(command_line_parse.since) if command_line_parse.since else None
+        until = get_epoch_minutes(command_line_parse.until) + MINUTES_PER_DAY if command_line_parse.until else None
+        with timer.phase("report"):
+            report = build_report(drawclients, command_line_parse.report, since, until)
+        print_report(report, command_line_parse.csv)
+        stop_profile(profiler, command_line_parse.profile)
+        timer.report("drawbillings")
+        return
+
+    if command_line_parse.export_dir:
+        with timer.phase("export"):
+            export_sessions(drawclients, command_line_parse.export_dir)
+        stop_profile(profiler, command_line_parse.profile)
+        timer.report("drawbillings")
+        return
+
+    executor = ProcessPoolExecutor(max_workers=command_line_parse.jobs) if command_line_parse.jobs > 1 else None
+    exporter = ChartExporter(command_line_parse.output_dir, command_line_parse.file_format) if command_line_parse.output_dir else None
+    query = command_line_parse.query_labels or command_line_parse.query_projects
+    window = get_window(command_line_parse.since, command_line_parse.until, command_line_parse.last)
+    client_data = load_clients(drawclients, rebuild_cache=command_line_parse.rebuild_cache, executor=executor,
+                               window=None if query else window, timer=timer)
+
+    exception = False
+    total_euro = 0
+    total_monthly_payout = 0
+    conversion_used = []
+
+    starting_time_columns = {}  
+
+    smallsep =  "---------"
+    bigsep = "---------------------"
+
+
+    for client in drawclients:
+        try:
+            print(bigsep)
+            print("Client: "+client.name)
+            if query:
+                with timer.phase("query", client):
+                    total_euro += query_billings(client, client_data[client.name].result()[0], command_line_parse)
+                continue
+            starting_time_columns[client.name] = []
         
-            data_active = pd.read_csv(f, sep=csv_delim)
-            starting_time_past = data_active.loc[:]["Starting time"]
-            minutes_past = data_active.loc[:]["Minutes"]
-            starting_time_columns[client.name].append((starting_time_past, minutes_past))
-            
-            for dir_path, directory_names, file_names in os.walk(client.history_folder, topdown=True):
-                # print(dir_path, directory_names, file_names, top_level_folder)
-                if os.path.exists(os.path.join(dir_path, client.past_billings_filename)):
-                    with open(os.path.join(dir_path, client.past_billings_filename), 'r') as p:
-                        data = pd.read_csv(p, sep=csv_delim)
-                        starting_time_past = data.loc[:]["Starting time"]
-                        minutes_past = data.loc[:]["Minutes"]
-                        starting_time_columns[client.name].append((starting_time_past, minutes_past))
-                        
-                elif os.path.exists(os.path.join(dir_path, client.get_billings_file_name())):
-                    with open(os.path.join(dir_path, client.get_billings_file_name()), 'r') as p:
-                        data = pd.read_csv(p, sep=csv_delim)
-                        starting_time_past = data.loc[:]["Starting time"]
-                        minutes_past = data.loc[:]["Minutes"]
-                        starting_time_columns[client.name].append((starting_time_past, minutes_past))                        
-
-            # df = pd.read_csv(f, sep=csv_delim)
-            df = data_active
-            starting_time = df.loc[:]["Starting time"]
-            minutes = df.loc[:]["Minutes"]
-            VERIFY_MINUTES = df["Minutes"].sum()
-            
-            # print("VERIFY_MINUTES: "+str(VERIFY_MINUTES))
+            sessions, history = client_data[client.name].result()
+            starting_time_columns[client.name].append((sessions.sessions["start"], sessions.get_minutes()))
+            starting_time_columns[client.name].extend(history)
 
-            labels = list(set(df.loc[:]["Labels"]))
-            projects = list(set(df.loc[:]["Projects"]))
+            VERIFY_MINUTES = sessions.total_minutes()
 
-            label_minutes = get_minutes_map(labels)
-            project_minutes = get_minutes_map(projects)
-
-            add_mins_for_column(label_minutes, labels, "Labels")
-            add_mins_for_column(project_minutes, projects, "Projects")
+            with timer.phase("minutes per label", client):
+                label_minutes = get_minutes_for_column(sessions, "labels", VERIFY_MINUTES)
+                project_minutes = get_minutes_for_column(sessions, "projects", VERIFY_MINUTES)
 
             labels_pie_values = list(label_minutes.values())
             labels_pie_legend = list(label_minutes.keys())
@@ -193,17 +388,20 @@ for client in drawclients:
             projects_pie_legend = list(project_minutes.keys())
 
             print(smallsep)
-            show_pie(client, labels_pie_values, labels_pie_legend)
-            print(smallsep)
-            show_pie(client, projects_pie_values, projects_pie_legend)            
-            print(smallsep)
+            with timer.phase("charts", client):
+                show_pie(client, labels_pie_values, labels_pie_legend, VERIFY_MINUTES, exporter, client.name + "_labels")
+                print(smallsep)
+                show_pie(client, projects_pie_values, projects_pie_legend, VERIFY_MINUTES, exporter, client.name + "_projects")            
+                print(smallsep)
 
 
-            #volumes = get_daily_work_volume(client, starting_time_columns[client.name])
+            if window is None:  # the rollup is built from all sessions
+                with timer.phase("daily work volume", client):
+                    volumes = get_daily_work_volume(client, starting_time_columns[client.name], sessions.stamp, rebuild=command_line_parse.rebuild_cache)
             #if len(starting_time_columns)==1:
             #    plt.hist(volumes, bins="auto")
             #    plt.show()
-                  
+              
             print("Total time worked: " + str(int(VERIFY_MINUTES//60)) + " hours and " + str(int(VERIFY_MINUTES%60)) + " minutes.") 
             print(smallsep)
             print("\n")
@@ -211,28 +409,18 @@ for client in drawclients:
             print("Total client billing: "+client.currency_symbol + to_truncated_string(income))
             client_euro = income*CONVERSIONS_TO_EUR[client.currency_symbol]
             total_euro += client_euro
-            
+        
             if client.currency_symbol != '€':
                 conversion_used.append(client.currency_symbol)
                 print_conversion_subscript(client, income)
-            
-            now = datetime.now().strftime(time_format)
-            today_int = int(now[0:2])
-            # print("Today: "+str(today_int))
-            
+
+            if window is not None:  # the expected payout needs all sessions of the billing period
+                continue
+
             if client_euro == 0:
                 print("No payments yet (expected payout cannot be calculated)")
             else:
-                days_past_due = today_int - client.due_date if today_int > client.due_date else ((31 + today_int) - client.due_date)
-                if days_past_due == 0:
-                    if(client_euro > 300):
-                        print("Got due date equal to today's day of the month, assuming the invoice contains a full month's work (is not new)")
-                        days_past_due = 31
-                    else:
-                        print("Got due date equal to today's day of the month, assuming the invoice is due in 31 days")
-                        days_past_due = 1
-                # print("Days past due: "+str(days_past_due))
-                payout_multiplicator = 31/days_past_due
+                payout_multiplicator = get_payout_multiplicator(client, client_euro)
                 # print("Client payout multiplicator: "+str(payout_multiplicator))
                 total_monthly_payout += payout_multiplicator*client_euro
 
@@ -241,29 +429,34 @@ for client in drawclients:
                     print("Expected client payout: "+client.currency_symbol+to_truncated_string(payout_multiplicator*income))
                     if client.currency_symbol != '€':
                         print_conversion_subscript(client, payout_multiplicator*income)
-                    
+                
                 print("\n")
                 print("End Client: "+client.name)
-                
-    except Exception as e:
-        exception = True
-        print(e)
+            
+        except Exception as e:
+            exception = True
+            print(e)
 
    
-if not exception:
-    
-    print(bigsep)
-    print("Total current billing"+ (" (conversion not up-to-date)" if conversion_used else "")+ ": €"+to_truncated_string(total_euro))
-    print("Expected end-of-billings payout (for these and no further clients, each over 31 days): \n\n\n          €"+to_truncated_string(total_monthly_payout)+"\n\n")
-    for symbol in conversion_used:
-        print("Conversion rate (not up-to-date) "+symbol+" -> € = "+to_truncated_string(CONVERSIONS_TO_EUR[symbol]))
-
-
-
-
-
-
+    if query or window is not None:
+        if not exception and len(drawclients) > 1:
+            print(bigsep)
+            print("Total billing of the matching sessions: €"+to_truncated_string(total_euro))
+    elif not exception:
 
+        print(bigsep)
+        print("Total current billing"+ (" (conversion not up-to-date)" if conversion_used else "")+ ": €"+to_truncated_string(total_euro))
+        print("Expected end-of-billings payout (for these and no further clients, each over 31 days): \n\n\n          €"+to_truncated_string(total_monthly_payout)+"\n\n")
+        for symbol in conversion_used:
+            print("Conversion rate (not up-to-date) "+symbol+" -> € = "+to_truncated_string(CONVERSIONS_TO_EUR[symbol]))
 
+    if executor is not None:
+        executor.shutdown()
+    if exporter is not None:
+        exporter.close()
+    stop_profile(profiler, command_line_parse.profile)
+    timer.report("drawbillings")
 
 
+if __name__ == "__main__":
+    main()
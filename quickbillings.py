@@ -0,0 +1,16 @@
+import sys
+
+from billingsdaemon import send_command
+
+"""
+Thin front end for writebillings: takes the same arguments, but lets a running billings daemon (see billingsdaemon.py)
+execute the command, and only falls back to running writebillings in this process if there is none.
+"""
+
+if __name__ == "__main__":
+    output = send_command(sys.argv[1:])
+    if output is None:
+        import writebillings
+        writebillings.main(sys.argv[1:])
+    else:
+        sys.stdout.write(output)
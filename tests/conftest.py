@@ -0,0 +1,52 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)  # the modules of the repository are not a package
+
+from billingsconstants import Client, header_string, time_format
+
+SESSION = "{};CODE,DOCS;Project;did things;{};{};"
+
+
+@pytest.fixture
+def client(tmp_path):
+    """
+    Client whose files are kept in a temporary financial folder
+    """
+    test_client = Client(None, "TestClient", 20., '€', "EN", 31)
+    test_client.financial_folder = str(tmp_path)
+    return test_client
+
+
+def write_sessions(path, lines, mode='w'):
+    """
+    Write a billings file with the given session lines (or append them with mode='a')
+    """
+    with open(path, mode) as f:
+        for line in ([header_string] if mode == 'w' else []) + lines:
+            f.write(line + "\n")
+
+
+def write_billings(path, lines, line_break="\n", trailing_line_break=True):
+    """
+    Write a billings file byte by byte, with the given line break
+    :return: The path as a string
+    """
+    with open(path, 'wb') as f:
+        f.write((line_break.join([header_string] + lines) + (line_break if trailing_line_break else "")).encode("utf-8"))
+    return str(path)
+
+
+def make_sessions(count, first=datetime(2026, 1, 1, 8, 0), step=timedelta(hours=7)):
+    """
+    :return: count closed sessions of 45 minutes, step apart
+    """
+    lines = []
+    for i in range(count):
+        start = first + i * step
+        lines.append(SESSION.format(start.strftime(time_format), (start + timedelta(minutes=45)).strftime(time_format), 45))
+    return lines
@@ -0,0 +1,58 @@
+from conftest import write_sessions
+from billingscheck import check_billings
+
+"""
+'check' and 'check --fix' (billingscheck) on .csv billings files.
+"""
+
+
+def read_lines(path):
+    with open(path, 'r') as f:
+        return f.read().splitlines()[1:]
+
+
+def test_fix_rewrites_wrong_minutes(client, capsys):
+    write_sessions(client.billings_filepath, [
+        "01.10.2026 10:00;CODE;P;healthy;01.10.2026 11:00;60;",
+        "02.10.2026 10:00;CODE;P;wrong;02.10.2026 11:00;50;",
+        "03.10.2026 10:00;CODE;P;no closing delimiter;03.10.2026 11:30;50",
+        "04.10.2026 23:30;CODE;P;over midnight;05.10.2026 00:15;45;",
+    ])
+    check_billings(client, full=True)
+    assert "Counted 2 faulty lines" in capsys.readouterr().out
+
+    check_billings(client, full=True, fix=True)
+    assert "Fixed the minutes of 2 lines" in capsys.readouterr().out
+    assert read_lines(client.billings_filepath) == [
+        "01.10.2026 10:00;CODE;P;healthy;01.10.2026 11:00;60;",
+        "02.10.2026 10:00;CODE;P;wrong;02.10.2026 11:00;60;",
+        "03.10.2026 10:00;CODE;P;no closing delimiter;03.10.2026 11:30;90;",
+        "04.10.2026 23:30;CODE;P;over midnight;05.10.2026 00:15;45;",
+    ]
+    assert read_lines(client.billings_backup_filepath)[1] == "02.10.2026 10:00;CODE;P;wrong;02.10.2026 11:00;50;"
+
+    check_billings(client, full=True)
+    assert "Got 5 healthy lines out of 5." in capsys.readouterr().out
+
+
+def test_fix_leaves_lines_with_other_fields_alone(client, capsys):
+    lines = ["01.10.2026 10:00;CODE;P;a ; in the description;01.10.2026 11:00;60;",
+             "02.10.2026 10:00;CODE;P;b;02.10.2026 11:00;50;",
+             "31.02.2026 10:00;CODE;P;c;01.03.2026 11:00;60;"]
+    write_sessions(client.billings_filepath, lines)
+    check_billings(client, full=True, fix=True)
+    output = capsys.readouterr().out
+    assert "Counted 3 faulty lines" in output
+    assert "Fixed the minutes of 1 line " in output
+    assert read_lines(client.billings_filepath) == [lines[0], "02.10.2026 10:00;CODE;P;b;02.10.2026 11:00;60;", lines[2]]
+
+
+def test_check_skips_checked_part(client, capsys):
+    write_sessions(client.billings_filepath, ["01.10.2026 10:00;CODE;P;a;01.10.2026 11:00;60;"])
+    check_billings(client)
+    capsys.readouterr()
+    write_sessions(client.billings_filepath, ["02.10.2026 10:00;CODE;P;b;02.10.2026 11:00;5;"], mode='a')
+    check_billings(client)
+    output = capsys.readouterr().out
+    assert "Skipped 2 lines that were already checked" in output
+    assert "Problem found with record on line 2" in output
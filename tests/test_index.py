@@ -0,0 +1,87 @@
+import os
+
+from conftest import write_sessions
+import billingsindex
+from billingsindex import bits_to_mask, load_session_index, select_sessions, update_session_index
+from billingsrollup import get_file_stamp
+from billingssessions import load_sessions
+from billingsstorage import parse_csv_line
+
+"""
+Label/project bitmap index (billingsindex): incremental updates by writebillings and rebuilds when queried.
+"""
+
+SESSIONS = ["01.10.2026 10:00;CODE,DOCS;Docker;a;01.10.2026 11:00;60;",
+            "02.10.2026 10:00;CODE;React;b;02.10.2026 11:00;60;",
+            "03.10.2026 10:00;COMM;Docker;c;03.10.2026 11:00;60;"]
+
+
+def get_selection(client, labels=(), projects=()):
+    sessions = load_sessions(client)
+    index = load_session_index(client, sessions)
+    return bits_to_mask(select_sessions(index, labels, projects), len(sessions)).tolist()
+
+
+def write_session(client, line, replace_last=False):
+    """
+    Write a session like writebillings does (append or replace the last line), then update the index
+    """
+    stamp_before = get_file_stamp(client.billings_filepath)
+    with open(client.billings_filepath, 'r') as f:
+        lines = f.read().splitlines()
+    write_sessions(client.billings_filepath, (lines[1:-1] if replace_last else lines[1:]) + [line])
+    update_session_index(client, client.billings_filepath, stamp_before, parse_csv_line(line), replace_last)
+
+
+def test_query_combines_labels_and_projects(client):
+    write_sessions(client.billings_filepath, SESSIONS)
+    assert get_selection(client, ["CODE"]) == [True, True, False]
+    assert get_selection(client, ["CODE"], ["Docker"]) == [True, False, False]
+    assert get_selection(client, ["CODE", "DOCS"]) == [True, False, False]
+    assert get_selection(client, ["MISSING"]) == [False, False, False]
+
+
+def test_incremental_updates_match_rebuild(client):
+    write_sessions(client.billings_filepath, SESSIONS[:1])
+    get_selection(client)  # build the index
+    write_session(client, "02.10.2026 10:00;CODE;MISC;;;;")  # start
+    write_session(client, SESSIONS[1], replace_last=True)  # end with other projects
+    write_session(client, SESSIONS[2])
+
+    incremental = {(labels, projects): get_selection(client, labels, projects)
+                   for labels in [(), ("CODE",), ("COMM",)] for projects in [(), ("Docker",), ("React",), ("MISC",)]}
+    sessions = load_sessions(client)
+    index = load_session_index(client, sessions, rebuild=True)
+    for (labels, projects), selection in incremental.items():
+        assert bits_to_mask(select_sessions(index, labels, projects), len(sessions)).tolist() == selection
+
+
+def test_change_while_reading_is_not_hidden_by_rebuild(client):
+    write_sessions(client.billings_filepath, SESSIONS[:2] + ["03.10.2026 10:00;CODE;MISC;;;;"])
+    sessions = load_sessions(client)
+    # the open session is ended with other labels after drawbillings read the file, but before it built the index
+    with open(client.billings_filepath, 'r') as f:
+        lines = f.read().splitlines()
+    write_sessions(client.billings_filepath, lines[1:-1] + [SESSIONS[2]])
+    load_session_index(client, sessions)
+
+    assert get_selection(client, ["COMM"], ["Docker"]) == [False, False, True]
+    assert get_selection(client, ["CODE"]) == [True, True, False]
+
+
+def test_updates_across_chunks(client, monkeypatch):
+    monkeypatch.setattr(billingsindex, "INDEX_CHUNK_SESSIONS", 4)
+    lines = ["{:02d}.10.2026 10:00;{};P{};;{:02d}.10.2026 11:00;60;".format(day, "CODE" if day % 3 else "COMM", day % 2, day)
+             for day in range(1, 8)]
+    write_sessions(client.billings_filepath, lines[:3])
+    get_selection(client)
+    for line in lines[3:]:
+        write_session(client, line)
+    assert len(os.listdir(client.session_index_filepath)) == 3  # meta file and two chunks
+
+    assert get_selection(client, ["COMM"]) == [day % 3 == 0 for day in range(1, 8)]
+    assert get_selection(client, ["CODE"], ["P1"]) == [bool(day % 3) and day % 2 == 1 for day in range(1, 8)]
+
+    write_sessions(client.billings_filepath, lines[:2])  # fewer sessions, e.g. after a rollover
+    assert get_selection(client, ["CODE"]) == [True, True]
+    assert len(os.listdir(client.session_index_filepath)) == 2
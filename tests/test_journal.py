@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from conftest import write_sessions
+import billingsjournal
+from billingsjournal import compact_journal_if_needed, read_journal, record_change, restore_to, undo_last_change
+from billingsstorage import get_storage, parse_csv_line
+
+"""
+Checks of undoing and restoring the changes recorded in the journal, made the way writebillings makes them.
+"""
+
+CLOSED = "01.10.2026 10:00;CODE;P;a;01.10.2026 11:00;60;"
+OPEN = "02.10.2026 10:00;DOCS;P;b;;;"
+ENDED = "02.10.2026 10:00;DOCS;P;b;02.10.2026 10:30;30;"
+
+
+def read_text(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def change(client, time_string, mode, line, replace_last):
+    compact_journal_if_needed(client)
+    storage = get_storage(client)
+    entry = parse_csv_line(line)
+    if replace_last:
+        _, last_entry = storage.read_last()
+        position = storage.replace_last(entry)
+        record_change(client, time_string, mode, position, last_entry.csv_format(), entry.csv_format())
+    else:
+        position = storage.append(entry)
+        record_change(client, time_string, mode, position, None, entry.csv_format())
+
+
+@pytest.fixture
+def journaled(client):
+    """
+    Billings file with one session, followed by a journaled 'start' and 'end'
+    :return: (client, text of the file before each change, text after the last one)
+    """
+    write_sessions(client.billings_filepath, [CLOSED])
+    texts = [read_text(client.billings_filepath)]
+    change(client, "02.10.2026 10:00", "start", OPEN, False)
+    texts.append(read_text(client.billings_filepath))
+    change(client, "02.10.2026 10:30", "end", ENDED, True)
+    texts.append(read_text(client.billings_filepath))
+    return client, texts
+
+
+def test_undo_takes_back_one_change_at_a_time(journaled):
+    client, texts = journaled
+    assert texts[2].splitlines()[-1] == ENDED
+    undo_last_change(client)
+    assert read_text(client.billings_filepath) == texts[1]
+    undo_last_change(client)
+    assert read_text(client.billings_filepath) == texts[0]
+    assert read_journal(client) == []
+    with pytest.raises(RuntimeError, match="No changes to undo"):
+        undo_last_change(client)
+
+
+def test_restore_undoes_the_changes_after_the_time(journaled):
+    client, texts = journaled
+    restore_to(client, "02.10.2026 10:15")
+    assert read_text(client.billings_filepath) == texts[1]
+    assert [entry["mode"] for _, entry in read_journal(client)] == ["start"]
+    restore_to(client, "01.10.2026 00:00")
+    assert read_text(client.billings_filepath) == texts[0]
+
+
+def test_undo_refuses_a_file_edited_by_hand(journaled):
+    client, texts = journaled
+    write_sessions(client.billings_filepath, [CLOSED, "03.10.2026 10:00;CODE;P;c;03.10.2026 10:05;5;"])
+    with pytest.raises(RuntimeError, match="does not match the journal"):
+        undo_last_change(client)
+    assert len(read_journal(client)) == 2
+
+
+def test_compaction_takes_a_snapshot_and_clears_the_journal(journaled, monkeypatch):
+    client, texts = journaled
+    monkeypatch.setattr(billingsjournal, "JOURNAL_COMPACTION_BYTES", 0)
+    compact_journal_if_needed(client)
+    assert read_journal(client) == []
+    assert read_text(get_storage(client).snapshot_path) == texts[2]
+    assert os.path.getsize(client.billings_journal_filepath) == 0
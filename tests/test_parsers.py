@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import SESSION, make_sessions, write_billings
+from billingsconstants import *
+from billingssessions import MISSING_TIME, encode_times, map_time_columns
+
+"""
+Checks of the byte-level readers (map_time_columns and encode_times) against a plain read of the same files with
+pd.read_csv and datetime.strptime.
+"""
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch_minutes(time_string):
+    try:
+        return int((datetime.strptime(time_string, time_format) - EPOCH).total_seconds() // 60)
+    except (TypeError, ValueError):
+        return MISSING_TIME
+
+
+def to_minutes(minutes_string):
+    try:
+        return float(minutes_string)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def read_reference(path):
+    """
+    :return: (starting time, ending time, minutes) of every session, read with pandas and strptime
+    """
+    with open(path, 'r', newline="") as f:
+        df = pd.read_csv(f, sep=csv_delim, dtype=str, keep_default_na=False)
+    return (np.array([to_epoch_minutes(s) for s in df["Starting time"]], dtype=np.int64),
+            np.array([to_epoch_minutes(s) for s in df["Ending time"]], dtype=np.int64),
+            np.array([to_minutes(s) for s in df["Minutes"]]))
+
+
+EDGE_CASES = {
+    "plain": (make_sessions(5), "\n", True),
+    "crlf": (make_sessions(5), "\r\n", True),
+    "no trailing line break": (make_sessions(5), "\n", False),
+    "crlf without trailing line break": (make_sessions(5), "\r\n", False),
+    "header only": ([], "\n", True),
+    "header only without line break": ([], "\n", False),
+    "missing closing delimiter": ([line[:-1] if i % 2 else line for i, line in enumerate(make_sessions(6))], "\n", True),
+    "decimal and empty minutes": ([SESSION.format("01.02.2026 10:00", "01.02.2026 11:30", "90.5"),
+                                   SESSION.format("02.02.2026 10:00", "", ""),
+                                   SESSION.format("03.02.2026 10:00", "03.02.2026 10:07", "7"),
+                                   SESSION.format("04.02.2026 10:00", "04.02.2026 10:07", "7.0"),
+                                   SESSION.format("05.02.2026 10:00", "05.02.2026 10:07", "abc")], "\n", True),
+    "invalid times": ([SESSION.format("31.02.2026 10:00", "01.03.2026 11:00", "60"),
+                       SESSION.format("01.13.2026 10:00", "01.01.2026 24:00", "60"),
+                       SESSION.format("01.01.2026 10:0x", "01.01.2026 10:00 ", "60")], "\r\n", True),
+    "open session last": (make_sessions(3) + ["01.03.2026 10:00;CODE;MISC;;;;"], "\n", False),
+}
+
+
+@pytest.mark.parametrize("case", EDGE_CASES)
+def test_map_time_columns_matches_read_csv(tmp_path, case):
+    lines, line_break, trailing_line_break = EDGE_CASES[case]
+    path = write_billings(tmp_path / "billings.csv", lines, line_break, trailing_line_break)
+    start, end, minutes = map_time_columns(path)
+    expected_start, expected_end, expected_minutes = read_reference(path)
+    np.testing.assert_array_equal(start, expected_start)
+    np.testing.assert_array_equal(end, expected_end)
+    np.testing.assert_array_equal(minutes, expected_minutes)
+
+
+def test_encode_times_matches_strptime():
+    times = ["01.01.2026 10:00", "29.02.2024 23:59", "29.02.2026 00:00", "31.12.1969 23:59", "1.1.2026 9:05",
+             "01.01.2026 24:00", "01.01.2026 10:00 ", "", None, np.nan, "  ", "ä1.01.2026 10:00", "01/01/2026 10:00"]
+    rng = np.random.default_rng(0)
+    times += [(EPOCH + timedelta(minutes=int(m))).strftime(time_format) for m in rng.integers(0, 60 * 24 * 365 * 80, 1000)]
+    expected = [to_epoch_minutes(t) if isinstance(t, str) and t.strip() else MISSING_TIME for t in times]
+    np.testing.assert_array_equal(encode_times(times), np.array(expected, dtype=np.int64))
@@ -0,0 +1,77 @@
+import os
+from datetime import date
+
+import pytest
+
+from conftest import write_sessions
+from billingsconstants import *
+from billingsrollover import get_next_due_day, is_rollover_due, read_summary, rollover_if_due
+
+"""
+Checks of the billing periods and of rolling the active file over into the history folder (the client is due on the
+31st, i.e. on the last day of every month).
+"""
+
+MALFORMED = "12.09.2026 10:00;CODE;P;line without the last fields"
+SESSIONS = [
+    "10.09.2026 10:00;CODE;P;a;10.09.2026 11:00;60;",
+    MALFORMED,
+    "29.09.2026 10:00;CODE,DOCS;Q;b;29.09.2026 10:30;30;",
+    "30.09.2026 10:00;CODE;P;c;30.09.2026 10:45;45;",  # on the due day, belongs to the next period
+    "02.10.2026 10:00;DOCS;P;d;;;",
+]
+
+
+def read_lines(path):
+    with open(path, 'r') as f:
+        return f.read().splitlines()
+
+
+@pytest.mark.parametrize("day,due_day", [
+    (date(2026, 2, 10), date(2026, 2, 28)),  # shorter month
+    (date(2026, 2, 28), date(2026, 3, 31)),  # on the due day
+    (date(2026, 12, 31), date(2027, 1, 31)),
+    (date(2024, 2, 29), date(2024, 3, 31)),
+])
+def test_next_due_day(day, due_day):
+    assert get_next_due_day(31, day) == due_day
+
+
+def test_rollover_archives_finished_periods(client):
+    write_sessions(client.billings_filepath, SESSIONS)
+    assert not is_rollover_due(client, date(2026, 9, 29))
+    assert rollover_if_due(client, date(2026, 9, 29)) == []
+
+    archived = rollover_if_due(client, date(2026, 10, 5))
+    assert archived == [os.path.join(client.history_folder, "2026-09-30", client.past_billings_filename)]
+    assert read_lines(archived[0]) == [header_string, SESSIONS[0], SESSIONS[2]]
+    assert read_lines(client.billings_filepath) == [header_string, MALFORMED] + SESSIONS[3:]
+
+    summary = read_summary(archived[0])
+    assert summary["sessions"] == 2 and summary["minutes"] == 90
+    assert summary["labels"] == {"CODE": 75, "DOCS": 15}
+    assert summary["days"] == {"10.09.2026": 60, "29.09.2026": 30}
+    assert not is_rollover_due(client, date(2026, 10, 5))
+
+
+def test_malformed_first_line_does_not_block_rollover(client):
+    write_sessions(client.billings_filepath, [MALFORMED] + SESSIONS[2:])
+    assert is_rollover_due(client, date(2026, 10, 1))
+    rollover_if_due(client, date(2026, 10, 1))
+    assert read_lines(client.billings_filepath) == [header_string, MALFORMED] + SESSIONS[3:]
+
+
+def test_summary_of_a_changed_archive_is_not_used(client):
+    write_sessions(client.billings_filepath, SESSIONS)
+    archive_path = rollover_if_due(client, date(2026, 10, 5))[0]
+    write_sessions(archive_path, ["11.09.2026 10:00;CODE;P;e;11.09.2026 10:10;10;"], mode='a')
+    assert read_summary(archive_path) is None
+
+
+def test_second_rollover_into_the_same_period_gets_its_own_folder(client):
+    write_sessions(client.billings_filepath, SESSIONS[:1])
+    first = rollover_if_due(client, date(2026, 10, 5))[0]
+    write_sessions(client.billings_filepath, SESSIONS[2:3])  # added to the past period by hand
+    second = rollover_if_due(client, date(2026, 10, 5))[0]
+    assert os.path.dirname(second) == os.path.dirname(first) + "_2"
+    assert read_lines(first) == [header_string, SESSIONS[0]] and read_lines(second) == [header_string, SESSIONS[2]]
@@ -0,0 +1,62 @@
+import numpy as np
+
+from conftest import write_sessions
+from billingsrollup import get_day_ordinal, get_file_stamp, load_daily_rollup, update_daily_rollup
+from billingssessions import load_sessions
+
+"""
+Daily rollup (billingsrollup): in-place updates after a command and rebuilds when the billings file changed.
+"""
+
+
+def get_columns(sessions):
+    return [(sessions.sessions["start"], sessions.get_minutes())]
+
+
+def get_day_minutes(first_ordinal, daily, time_string):
+    index = get_day_ordinal(time_string) - first_ordinal
+    return int(daily[index]) if 0 <= index < len(daily) else 0
+
+
+def test_update_adds_minutes_in_place(client):
+    write_sessions(client.billings_filepath, ["01.10.2026 10:00;CODE;P;a;01.10.2026 11:00;60;"])
+    sessions = load_sessions(client)
+    load_daily_rollup(client, get_columns(sessions), sessions.stamp)
+
+    stamp_before = get_file_stamp(client.billings_filepath)
+    write_sessions(client.billings_filepath, ["03.10.2026 10:00;CODE;P;b;03.10.2026 10:30;30;"], mode='a')
+    update_daily_rollup(client, client.billings_filepath, stamp_before, "03.10.2026 10:00", 30)
+
+    first_ordinal, daily = load_daily_rollup(client, [], get_file_stamp(client.billings_filepath))  # no rebuild needed
+    assert get_day_minutes(first_ordinal, daily, "01.10.2026") == 60
+    assert get_day_minutes(first_ordinal, daily, "03.10.2026") == 30
+    assert daily.sum() == 90
+
+
+def test_update_ignores_rollup_of_other_file_state(client):
+    write_sessions(client.billings_filepath, ["01.10.2026 10:00;CODE;P;a;01.10.2026 11:00;60;"])
+    sessions = load_sessions(client)
+    load_daily_rollup(client, get_columns(sessions), sessions.stamp)
+    write_sessions(client.billings_filepath, ["02.10.2026 10:00;CODE;P;b;02.10.2026 11:00;60;"], mode='a')  # by hand
+
+    stamp_before = get_file_stamp(client.billings_filepath)
+    write_sessions(client.billings_filepath, ["03.10.2026 10:00;CODE;P;c;03.10.2026 10:30;30;"], mode='a')
+    update_daily_rollup(client, client.billings_filepath, stamp_before, "03.10.2026 10:00", 30)
+
+    sessions = load_sessions(client)
+    _, daily = load_daily_rollup(client, get_columns(sessions), sessions.stamp)
+    assert daily.sum() == 150
+
+
+def test_change_while_reading_is_not_hidden_by_rebuild(client):
+    write_sessions(client.billings_filepath, ["01.10.2026 10:00;CODE;P;a;01.10.2026 11:00;60;"])
+    sessions = load_sessions(client)
+    # a session is added after drawbillings read the file, but before it rebuilt the rollup
+    write_sessions(client.billings_filepath, ["01.10.2026 12:00;CODE;P;b;01.10.2026 13:00;60;"], mode='a')
+    _, daily = load_daily_rollup(client, get_columns(sessions), sessions.stamp)
+    assert daily.sum() == 60  # what was read
+
+    sessions = load_sessions(client)
+    first_ordinal, daily = load_daily_rollup(client, get_columns(sessions), sessions.stamp)
+    assert get_day_minutes(first_ordinal, daily, "01.10.2026") == 120
+    np.testing.assert_array_equal(daily, np.array([120]))
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from billingsconstants import *
+from billingssessions import SessionTable
+
+"""
+Checks of building a SessionTable from billings data with missing fields.
+"""
+
+
+def make_frame(labels, projects, minutes):
+    count = len(minutes)
+    return pd.DataFrame({"Starting time": ["01.03.2026 10:00"] * count, "Labels": labels, "Projects": projects,
+                         "Description": [""] * count, "Ending time": ["01.03.2026 11:00"] * count, "Minutes": minutes})
+
+
+def test_missing_labels_and_projects_count_as_default_label():
+    sessions = SessionTable.from_frame(make_frame(["CODE", np.nan, "CODE,DOCS"], [np.nan, "Project", "Project"], [60, 30, 20]))
+    assert (sessions.sessions["labels"] >= 0).all() and (sessions.sessions["projects"] >= 0).all()
+    assert sessions.minutes_per_name("labels") == {"CODE": 70., default_label_string: 30., "DOCS": 10.}
+    assert sessions.minutes_per_name("projects") == {default_label_string: 60., "Project": 50.}
+    assert list(sessions.get_set_strings("labels")) == ["CODE", default_label_string, "CODE,DOCS"]
+
+
+def test_all_labels_missing():
+    sessions = SessionTable.from_frame(make_frame([np.nan, None], ["Project", "Project"], [15, 45]))
+    assert sessions.minutes_per_name("labels") == {default_label_string: 60.}
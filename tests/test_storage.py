@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from conftest import make_sessions, write_billings
+from billingsconstants import *
+from billingsstorage import TAIL_BLOCK_SIZE, get_start_key, get_storage, get_window, parse_csv_line, read_window_lines
+
+"""
+Checks of the binary search of read_window_lines against a full read of the same files, and of appending and patching
+the last line of the .csv file.
+"""
+
+
+def read_window_reference(path, window):
+    """
+    :return: The lines of a full read that fall into the window, as read_window_lines returns them
+    """
+    with open(path, 'r', newline="") as f:
+        lines = f.read().splitlines(keepends=True)[1:]
+    keys = [get_start_key(line[:16]) for line in lines]
+    selected = [line for line, key in zip(lines, keys)
+                if (window.since is None or key >= window.since) and (window.until is None or key <= window.until)]
+    if window.last is not None:
+        selected = selected[len(selected) - window.last:] if window.last > 0 else []
+    return "".join(selected)
+
+
+WINDOWS = [
+    ("01.01.2026", None, None),  # from the first day on (the start of the file)
+    ("01.01.2020", "01.01.2026", None),  # only the first day
+    (None, "01.01.2020", None),  # before the first session
+    ("15.02.2026", "20.02.2026", None),
+    ("10.02.2026", "10.02.2026", 2),
+    (None, None, 1),  # the end of the file
+    (None, None, 3),
+    (None, None, 5000),  # more sessions than there are
+    ("01.01.2030", None, None),  # after the last session
+    (None, None, 0),
+]
+
+
+@pytest.mark.parametrize("line_break,trailing_line_break", [("\n", True), ("\r\n", True), ("\n", False)])
+@pytest.mark.parametrize("since,until,last", WINDOWS)
+def test_read_window_lines_matches_full_read(tmp_path, line_break, trailing_line_break, since, until, last):
+    lines = make_sessions(1500)  # several TAIL_BLOCK_SIZE blocks
+    path = write_billings(tmp_path / "billings.csv", lines, line_break, trailing_line_break)
+    assert os.path.getsize(path) > 4 * TAIL_BLOCK_SIZE
+    window = get_window(since, until, last)
+    header, data = read_window_lines(path, window)
+    assert header == header_string + line_break
+    assert data == read_window_reference(path, window)
+
+
+def read_last_line(storage):
+    position, entry = storage.read_last()
+    return position, entry.csv_format() if entry is not None else None
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("line_break,ending", [
+    (os.linesep, os.linesep),  # written in place
+    (os.linesep, ""),
+    ("\r\n" if os.linesep == "\n" else "\n",) * 2,
+    (os.linesep, os.linesep * 3),  # empty lines at the end
+])
+@pytest.mark.parametrize("count", [0, 1, 3])
+def test_append_and_replace_last_line(client, line_break, ending, count):
+    lines = make_sessions(count)
+    with open(client.billings_filepath, 'wb') as f:
+        f.write((line_break.join([header_string] + lines) + ending).encode("utf-8"))
+    before = read_bytes(client.billings_filepath)
+    storage = get_storage(client)
+    in_place = count > 0 and line_break == ending == os.linesep
+
+    opened = parse_csv_line("01.03.2026 10:00;CODE;MISC;;;;")
+    position = storage.append(opened)
+    after_append = read_bytes(client.billings_filepath)
+    assert after_append.decode("utf-8").splitlines() == [header_string] + lines + [opened.csv_format()]
+    assert after_append[position:] == (opened.csv_format() + os.linesep).encode("utf-8")
+    if in_place:
+        assert after_append.startswith(before)
+
+    closed = parse_csv_line("01.03.2026 10:00;CODE;MISC;;01.03.2026 10:30;30;")
+    assert read_last_line(storage) == (position, opened.csv_format())
+    assert storage.replace_last(closed) == position
+    assert read_bytes(client.billings_filepath) == after_append[:position] + (closed.csv_format() + os.linesep).encode("utf-8")
+    assert read_last_line(storage) == (position, closed.csv_format())
+
+    storage.remove_last()
+    assert read_bytes(client.billings_filepath) == after_append[:position]
+    assert read_last_line(storage)[1] == (parse_csv_line(lines[-1]).csv_format() if lines else None)
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from conftest import write_sessions
+from billingswatch import ActiveTotals
+
+"""
+Live totals of drawbillings --watch (billingswatch.ActiveTotals), which only parse the end of the billings file.
+"""
+
+SESSIONS = ["01.10.2026 10:00;CODE;P;a;01.10.2026 11:00;60;",
+            "01.10.2026 12:00;CODE;P;a ; b;01.10.2026 12:30;30;",  # a ';' typed into the description
+            "02.10.2026 10:00;CODE;P;c;02.10.2026 10:45;45;"]
+
+
+def test_unreadable_lines_are_skipped(client):
+    write_sessions(client.billings_filepath, SESSIONS)
+    totals = ActiveTotals(client)
+    assert totals.refresh()
+    assert totals.total_minutes() == 105
+    assert totals.get_day_minutes(datetime(2026, 10, 1)) == 60
+    assert totals.unreadable_lines() == 1
+
+    write_sessions(client.billings_filepath, ["03.10.2026 10:00;CODE;P;half written"], mode='a')
+    assert totals.refresh()
+    assert totals.total_minutes() == 105
+    assert totals.unreadable_lines() == 2
+
+
+def test_appended_and_taken_back_sessions(client):
+    write_sessions(client.billings_filepath, SESSIONS[:1])
+    totals = ActiveTotals(client)
+    totals.refresh()
+    write_sessions(client.billings_filepath, ["02.10.2026 10:00;CODE;P;c;;;"], mode='a')  # start
+    totals.refresh()
+    assert totals.total_minutes() == 60
+    assert totals.get_open_session(datetime(2026, 10, 2, 10, 20)) == (20, False)
+
+    write_sessions(client.billings_filepath, SESSIONS[:1])  # undo
+    assert totals.refresh()
+    assert totals.total_minutes() == 60
+    assert totals.get_open_session(datetime(2026, 10, 2, 10, 20)) is None
+    assert totals.unreadable_lines() == 0